@@ -0,0 +1,290 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# In-process benchmarks of ingest, rendering and memory growth. Results are
+# printed as JSON so runs can be diffed between versions:
+#
+#   python bench.py --frames 2000 --output bench-$(git rev-parse --short HEAD).json
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak rather than current RSS, but still shows growth.
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+def latency_summary(seconds) -> dict:
+    ms = np.asarray(seconds) * 1e3
+    p50, p90, p99 = np.percentile(ms, (50, 90, 99))
+    return {
+        "n": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(p50),
+        "p90_ms": float(p90),
+        "p99_ms": float(p99),
+        "max_ms": float(ms.max()),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_ingest(client, bodies, path: str, content_type: str) -> dict:
+    latencies = []
+    start = time.perf_counter()
+    for body in bodies:
+        tic = time.perf_counter()
+        r = client.post(path, content=body, headers={"content-type": content_type})
+        latencies.append(time.perf_counter() - tic)
+        r.raise_for_status()
+    elapsed = time.perf_counter() - start
+    return {
+        "frames_per_s": len(bodies) / elapsed,
+        "latency": latency_summary(latencies),
+    }
+
+
+def bench_draw_b64(frames, renders: int, blit: bool) -> dict:
+    from dmvis import DMPlot, DMVisualisation
+
+    dmvis = DMVisualisation(blit=blit, xscroll_step=1.0 if blit else None)
+    warmup = len(frames) - renders
+    for f in frames[:warmup]:
+        dmvis.update_dmplot_state(DMPlot.model_validate(f))
+    dmvis.draw_b64()
+
+    latencies = []
+    for f in frames[warmup:]:
+        dmvis.update_dmplot_state(DMPlot.model_validate(f))
+        tic = time.perf_counter()
+        dmvis.draw_b64()
+        latencies.append(time.perf_counter() - tic)
+    dmvis.close()
+    return latency_summary(latencies)
+
+
+def bench_profiles(frames, renders: int) -> dict:
+    from dmvis import DMPlot, DMVisualisation
+    from encoders import PROFILES
+
+    dmvis = DMVisualisation(blit=True, xscroll_step=1.0)
+    for f in frames[: len(frames) - renders]:
+        dmvis.update_dmplot_state(DMPlot.model_validate(f))
+
+    results = {}
+    for name in PROFILES:
+        latencies, sizes = [], []
+        dmvis.render(name)
+        for f in frames[len(frames) - renders :]:
+            dmvis.update_dmplot_state(DMPlot.model_validate(f))
+            tic = time.perf_counter()
+            _, data = dmvis.render(name)
+            latencies.append(time.perf_counter() - tic)
+            sizes.append(len(data))
+        results[name] = latency_summary(latencies)
+        results[name]["mean_bytes"] = float(np.mean(sizes))
+    dmvis.close()
+    return results
+
+
+def bench_panels(frames, renders: int) -> dict:
+    from dmvis import PANELS, DMPlot, DMVisualisation
+
+    dmvis = DMVisualisation(blit=True, xscroll_step=1.0)
+    for f in frames[: len(frames) - renders]:
+        dmvis.update_dmplot_state(DMPlot.model_validate(f))
+
+    results = {}
+    for panel in (None,) + PANELS:
+        latencies = []
+        dmvis.render(panel=panel)
+        for f in frames[len(frames) - renders :]:
+            dmvis.update_dmplot_state(DMPlot.model_validate(f))
+            tic = time.perf_counter()
+            dmvis.render(panel=panel)
+            latencies.append(time.perf_counter() - tic)
+        results[panel or "figure"] = latency_summary(latencies)
+    dmvis.close()
+    return results
+
+
+def bench_get(client, path: str, n: int, headers=None) -> dict:
+    latencies = []
+    for _ in range(n):
+        tic = time.perf_counter()
+        r = client.get(path, headers=headers)
+        if r.is_error:
+            r.raise_for_status()
+        latencies.append(time.perf_counter() - tic)
+    return latency_summary(latencies)
+
+
+STARTUP_SCRIPT = """
+import json, time
+tic = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.sessions.get(main.DEFAULT_SESSION).dmvis.render()
+rendered = time.perf_counter()
+print(json.dumps([imported - tic, rendered - imported]))
+"""
+
+
+def bench_startup(runs: int) -> dict:
+    # Each run is a fresh interpreter, as after a restart in the field: wall
+    # time to spawn it, import the app and render its first frame.
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    wall, imports, first_frames = [], [], []
+    for _ in range(runs):
+        tic = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=cwd,
+        ).stdout
+        wall.append(time.perf_counter() - tic)
+        imported, rendered = json.loads(out.splitlines()[-1])
+        imports.append(imported)
+        first_frames.append(rendered)
+    return {
+        "process": latency_summary(wall),
+        "import_main": latency_summary(imports),
+        "first_frame": latency_summary(first_frames),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark ingest, rendering and memory growth in-process."
+    )
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--renders", type=int, default=50)
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=100,
+        help="frames ingested and rendered before memory is first sampled",
+    )
+    parser.add_argument("--rail-horizon", type=int, default=31)
+    parser.add_argument("--obstacles", type=int, default=1)
+    parser.add_argument("--railway-obstacles", type=int, default=1)
+    parser.add_argument("--detected-objects", type=int, default=1)
+    parser.add_argument("--trajectory", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--render-fps",
+        type=float,
+        default=None,
+        help="DMVIS_RENDER_FPS for the server under test (default: its own)",
+    )
+    parser.add_argument(
+        "--startup-runs",
+        type=int,
+        default=5,
+        help="fresh interpreters to time importing the server (0 to skip)",
+    )
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    if args.render_fps is not None:
+        os.environ["DMVIS_RENDER_FPS"] = str(args.render_fps)
+
+    from fastapi.testclient import TestClient
+
+    import main as server
+    import wire
+    from dmvis import DMPlot
+    from synth import DMPlotGenerator
+
+    generator = DMPlotGenerator(
+        rail_horizon=args.rail_horizon,
+        obstacles=args.obstacles,
+        railway_obstacles=args.railway_obstacles,
+        detected_objects=args.detected_objects,
+        trajectory=args.trajectory,
+        seed=args.seed,
+    )
+    frames = list(generator.frames(args.warmup + args.frames))
+    warmup_bodies = [json.dumps(f).encode() for f in frames[: args.warmup]]
+    frames = frames[args.warmup :]
+    json_bodies = [json.dumps(f).encode() for f in frames]
+    wire_bodies = [wire.encode(DMPlot.model_validate(f)) for f in frames]
+
+    results = {}
+    if args.startup_runs:
+        results["startup"] = bench_startup(args.startup_runs)
+    with TestClient(server.app) as client:
+        # Sample memory only once the session exists and has drawn a frame,
+        # so the growth below is what ingest adds and not the figure, the
+        # render loop or first-use allocations.
+        if warmup_bodies:
+            bench_ingest(client, warmup_bodies, "/dmvis", "application/json")
+            client.get("/dmvis.png").raise_for_status()
+            server.sessions.get(server.DEFAULT_SESSION).renderer.wait_frame()
+        rss_before = rss_bytes()
+        results["ingest_json"] = bench_ingest(
+            client, json_bodies, "/dmvis", "application/json"
+        )
+        rss_after = rss_bytes()
+        results["ingest_wire"] = bench_ingest(
+            client, wire_bodies, "/dmvis", wire.MEDIA_TYPE
+        )
+        results["dmvisdebug"] = bench_get(client, "/dmvisdebug", args.renders)
+        etag = client.get("/dmvisdebug").headers["etag"]
+        results["dmvisdebug_not_modified"] = bench_get(
+            client, "/dmvisdebug", args.renders, headers={"if-none-match": etag}
+        )
+        results["memory"] = {
+            "rss_before_bytes": rss_before,
+            "rss_after_bytes": rss_after,
+            "rss_growth_bytes": rss_after - rss_before,
+            "rss_growth_per_frame_bytes": (rss_after - rss_before) / args.frames,
+        }
+
+    renders = min(args.renders, args.frames - 1)
+    results["draw_b64"] = bench_draw_b64(frames, renders, blit=False)
+    results["draw_b64_blit"] = bench_draw_b64(frames, renders, blit=True)
+    results["profiles"] = bench_profiles(frames, renders)
+    results["panels"] = bench_panels(frames, renders)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
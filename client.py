@@ -0,0 +1,139 @@
+import threading
+import time
+
+import requests
+
+import wire
+from dmvis import DMPlot
+
+DMVIS_DATA_URL = "http://127.0.0.1:8000/dmvis_data"
+
+
+class DMPlotClient:
+    def __init__(
+        self,
+        url: str = DMVIS_DATA_URL,
+        interval: float = 0.02,
+        timeout: float = 1.0,
+        retry_interval: float = 0.5,
+        long_poll: float = None,
+    ):
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        # Seconds the server may hold each request waiting for a newer
+        # state. Latency then includes that wait.
+        self.long_poll = long_poll
+        self.version = None
+
+        # One pooled keep-alive connection for every poll. The compact wire
+        # format is cheaper to decode than JSON.
+        self.http = requests.Session()
+        self.http.headers["Accept"] = f"{wire.MEDIA_TYPE}, application/json"
+
+        self.received = 0
+        self.consumed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.latency = 0.0
+        self.latency_avg = 0.0
+        self.latency_max = 0.0
+
+        self._state = None
+        self._fresh = False
+        self._last_body = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="dmvis-client", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.http.close()
+
+    @property
+    def latest(self):
+        return self._state
+
+    def take(self):
+        # The newest state if it arrived since the last take, else None.
+        with self._lock:
+            if not self._fresh:
+                return None
+            self._fresh = False
+            self.consumed += 1
+            return self._state
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "consumed": self.consumed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "latency_ms": self.latency * 1e3,
+            "latency_avg_ms": self.latency_avg * 1e3,
+            "latency_max_ms": self.latency_max * 1e3,
+        }
+
+    def fetch(self):
+        params = {}
+        timeout = self.timeout
+        if self.long_poll is not None and self.version is not None:
+            params = {"since": self.version, "timeout": self.long_poll}
+            timeout += self.long_poll
+
+        tic = time.perf_counter()
+        r = self.http.get(self.url, params=params, timeout=timeout)
+        r.raise_for_status()
+        self._record_latency(time.perf_counter() - tic)
+
+        if r.status_code == 304:
+            return
+        if "X-DMVis-Version" in r.headers:
+            self.version = int(r.headers["X-DMVis-Version"])
+        if r.content == self._last_body:
+            # The server has nothing newer.
+            return
+        self._last_body = r.content
+
+        if r.headers.get("content-type", "").startswith(wire.MEDIA_TYPE):
+            state = wire.decode(r.content)
+        else:
+            state = DMPlot.model_validate_json(r.content)
+
+        with self._lock:
+            if self._fresh:
+                # The previous state was never drawn.
+                self.dropped += 1
+            self._state = state
+            self._fresh = True
+            self.received += 1
+
+    def _record_latency(self, latency: float):
+        self.latency = latency
+        if self.latency_avg == 0.0:
+            self.latency_avg = latency
+        else:
+            self.latency_avg += 0.1 * (latency - self.latency_avg)
+        self.latency_max = max(self.latency_max, latency)
+
+    def _run(self):
+        while not self._stop.is_set():
+            tic = time.perf_counter()
+            try:
+                self.fetch()
+            except (requests.RequestException, ValueError):
+                self.errors += 1
+                self._stop.wait(self.retry_interval)
+                continue
+            self._stop.wait(max(0.0, self.interval - (time.perf_counter() - tic)))
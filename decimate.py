@@ -0,0 +1,62 @@
+import numpy as np
+
+# Both reducers keep the first and last sample and take x in sample order,
+# so they suit the monotonic time axes of the history panels.
+
+
+def minmax(x: np.ndarray, y: np.ndarray, buckets: int):
+    # Keeps the smallest and largest sample of each of `buckets` equal runs,
+    # in their original order. With one bucket per pixel column the line
+    # draws the same as the full series, spikes included.
+    n = len(y)
+    if buckets < 1 or n <= 2 * buckets + 2:
+        return x, y
+
+    k = (n - 2) // buckets
+    end = 1 + buckets * k
+    runs = y[1:end].reshape(buckets, k)
+    lo = runs.argmin(axis=1)
+    hi = runs.argmax(axis=1)
+
+    base = 1 + np.arange(buckets) * k
+    idx = np.empty(2 * buckets + 1 + n - end, dtype=np.intp)
+    idx[0] = 0
+    idx[1 : 2 * buckets + 1 : 2] = base + np.minimum(lo, hi)
+    idx[2 : 2 * buckets + 1 : 2] = base + np.maximum(lo, hi)
+    idx[2 * buckets + 1 :] = np.arange(end, n)
+    return x[idx], y[idx]
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int):
+    # Largest-Triangle-Three-Buckets: one sample per bucket, chosen to keep
+    # the shape of the line. Smoother than minmax for the same point count,
+    # but sequential, so it is meant for reports rather than live frames.
+    n = len(y)
+    if threshold < 3 or n <= threshold:
+        return x, y
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.intp)
+    sums_x = np.add.reduceat(x[: n - 1], edges[:-1])
+    sums_y = np.add.reduceat(y[: n - 1], edges[:-1])
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[n - 1])
+    avg_y = np.append(sums_y / counts, y[n - 1])
+
+    idx = np.empty(threshold, dtype=np.intp)
+    idx[0] = 0
+    idx[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        a = lo + int(area.argmax())
+        idx[i + 1] = a
+    return x[idx], y[idx]
+
+
+REDUCERS = {
+    "minmax": minmax,
+    "lttb": lttb,
+}
@@ -0,0 +1,187 @@
+from collections import OrderedDict
+
+import numpy as np
+from pydantic_core import to_json
+
+from dmvis import OBSTACLE_DTYPE, DMPlot, _serialize_obstacles, _serialize_points
+
+# Messages are JSON objects of one of two kinds:
+#
+#   keyframe: {"version": v, "key": true, "state": <DMPlot>}
+#   delta:    {"version": v, "base": b, "delta": {...}}
+#
+# A delta holds only what changed since version b, by section:
+#   tram_state / tram_state_transition: {field: value}
+#   hlc_state: {"speed_setpoint": value,
+#               <point list>: [points] (replaced) or
+#                             {"n": length, "set": [[i, x, y], ...]},
+#               <obstacle list>: [obstacles] (replaced) or
+#                                {"upsert": [obstacles], "remove": [ids]}}
+#
+# Obstacles are matched by id: kept ones stay in place, updated ones change
+# in place and new ones are appended.
+#
+# Non-finite floats (ttc is inf with nothing ahead) are sent as null, as
+# model_dump_json does; JSON has no Infinity.
+
+KEYFRAME_INTERVAL = 100
+
+POINT_FIELDS = (
+    "list_rail_horizon",
+    "list_detected_object",
+    "list_trajectory_prediction",
+)
+OBSTACLE_FIELDS = (
+    "list_detected_obstacle",
+    "list_detected_railway_obstacle",
+)
+
+
+def _diff_scalars(old, new):
+    changed = {}
+    for name in type(new).model_fields:
+        value = getattr(new, name)
+        if getattr(old, name) != value:
+            changed[name] = value
+    return changed
+
+
+def _diff_points(old: np.ndarray, new: np.ndarray):
+    if len(old) == len(new):
+        changed = np.flatnonzero((old != new).any(axis=1))
+        if len(changed) == 0:
+            return None
+        if len(changed) <= len(new) // 2:
+            return {
+                "n": len(new),
+                "set": [[int(i), x, y] for i, (x, y) in zip(changed, new[changed].tolist())],
+            }
+    return _serialize_points(new)
+
+
+def _diff_obstacles(old: np.ndarray, new: np.ndarray):
+    if np.array_equal(old, new):
+        return None
+
+    old_rows = {row[0]: row for row in old.tolist()}
+    new_rows = {row[0]: row for row in new.tolist()}
+    if len(old_rows) != len(old) or len(new_rows) != len(new):
+        # Duplicate ids cannot be patched by id.
+        return _serialize_obstacles(new)
+
+    order = [i for i in old_rows if i in new_rows]
+    order += [i for i in new_rows if i not in old_rows]
+    if order != list(new_rows):
+        return _serialize_obstacles(new)
+
+    upsert = [row for i, row in new_rows.items() if old_rows.get(i) != row]
+    return {
+        "upsert": [dict(zip(OBSTACLE_DTYPE.names, row)) for row in upsert],
+        "remove": [i for i in old_rows if i not in new_rows],
+    }
+
+
+def diff(old: DMPlot, new: DMPlot) -> dict:
+    delta = {}
+    for section in ("tram_state", "tram_state_transition"):
+        changed = _diff_scalars(getattr(old, section), getattr(new, section))
+        if changed:
+            delta[section] = changed
+
+    hlc = {}
+    if old.hlc_state.speed_setpoint != new.hlc_state.speed_setpoint:
+        hlc["speed_setpoint"] = new.hlc_state.speed_setpoint
+    for name in POINT_FIELDS:
+        d = _diff_points(getattr(old.hlc_state, name), getattr(new.hlc_state, name))
+        if d is not None:
+            hlc[name] = d
+    for name in OBSTACLE_FIELDS:
+        d = _diff_obstacles(getattr(old.hlc_state, name), getattr(new.hlc_state, name))
+        if d is not None:
+            hlc[name] = d
+    if hlc:
+        delta["hlc_state"] = hlc
+
+    return delta
+
+
+def dumps(message: dict) -> str:
+    return to_json(message, inf_nan_mode="null").decode()
+
+
+def apply(state: dict, delta: dict) -> dict:
+    # Applies a delta to a state in its JSON form, as a client holds it.
+    state = {section: dict(values) for section, values in state.items()}
+    state["tram_state"].update(delta.get("tram_state", {}))
+    state["tram_state_transition"].update(delta.get("tram_state_transition", {}))
+
+    hlc = state["hlc_state"]
+    for name, d in delta.get("hlc_state", {}).items():
+        if name == "speed_setpoint" or isinstance(d, list):
+            hlc[name] = d
+        elif name in POINT_FIELDS:
+            points = list(hlc[name][: d["n"]])
+            points += [None] * (d["n"] - len(points))
+            for i, x, y in d["set"]:
+                points[i] = {"x": x, "y": y}
+            hlc[name] = points
+        else:
+            removed = set(d["remove"])
+            upsert = {o["id"]: o for o in d["upsert"]}
+            obstacles = [
+                upsert.pop(o["id"], o) for o in hlc[name] if o["id"] not in removed
+            ]
+            hlc[name] = obstacles + list(upsert.values())
+
+    return state
+
+
+class DeltaLog:
+    def __init__(self, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.keyframe_version = None
+        self.version = None
+
+        # States since the last keyframe, the only bases deltas are made from.
+        # A client whose base is older gets a keyframe, so every client is
+        # resynchronised at least once per keyframe interval.
+        self._states = OrderedDict()
+        self._messages = {}
+
+    def record(self, version: int, state: DMPlot):
+        if (
+            self.keyframe_version is None
+            or version < self.keyframe_version
+            or version - self.keyframe_version >= self.keyframe_interval
+        ):
+            self.keyframe_version = version
+            self._states.clear()
+        self._states[version] = state
+        self._messages.clear()
+        self.version = version
+
+    def message(self, since: int = None) -> str:
+        # The current state for a client that has version `since`, as a
+        # delta when possible. Clients at the same base share the encoding.
+        if self.version is None:
+            return None
+
+        base = since if since in self._states else None
+        message = self._messages.get(base)
+        if message is None:
+            state = self._states[self.version]
+            if base is None:
+                message = {
+                    "version": self.version,
+                    "key": True,
+                    "state": state.model_dump(mode="json"),
+                }
+            else:
+                message = {
+                    "version": self.version,
+                    "base": base,
+                    "delta": diff(self._states[base], state),
+                }
+            message = dumps(message)
+            self._messages[base] = message
+        return message
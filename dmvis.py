@@ -1,17 +1,25 @@
-from typing import List
+from typing import Annotated, List, Tuple
+from operator import attrgetter, itemgetter
 from enum import IntEnum
-from pydantic import BaseModel
+from pydantic import (
+    BaseModel,
+    Field,
+    FiniteFloat,
+    PlainSerializer,
+    PlainValidator,
+    TypeAdapter,
+    WithJsonSchema,
+)
 
-import matplotlib
 import numpy as np
 
-from matplotlib import pyplot as plt
-from matplotlib.figure import Figure
-import matplotlib.animation as animation
-from io import BytesIO
 import base64
+import math
+import threading
 
-import requests
+from decimate import REDUCERS
+from encoders import DEFAULT_PROFILE, PROFILES
+from history import History
 
 
 class PowerLevel(IntEnum):
@@ -36,7 +44,9 @@ class TramState(BaseModel):
     x: float
     y: float
     v: float
-    t: float
+    # The time axes and history are keyed on t, so inf or nan would break
+    # every later render.
+    t: FiniteFloat
 
 
 class FSMState(IntEnum):
@@ -68,14 +78,104 @@ class ObstacleState(BaseModel):
     d: float
 
 
+OBSTACLE_DTYPE = np.dtype(
+    [
+        ("id", np.int64),
+        ("x", np.float64),
+        ("y", np.float64),
+        ("v", np.float64),
+        ("d", np.float64),
+    ]
+)
+
+
+def _rows(v, names, what: str):
+    # Tuples of the named fields. The getters pull them out of JSON dicts
+    # without a Python-level loop; models, alone or mixed in, go one by one.
+    try:
+        try:
+            return list(map(itemgetter(*names), v))
+        except TypeError:
+            by_key, by_attr = itemgetter(*names), attrgetter(*names)
+            return [by_key(o) if isinstance(o, dict) else by_attr(o) for o in v]
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"expected a list of {what}: {e!r}")
+
+
+_XY_PAIRS = TypeAdapter(List[Tuple[float, float]])
+
+
+def _validate_points(v) -> np.ndarray:
+    if isinstance(v, np.ndarray):
+        points = np.asarray(v, dtype=np.float64)
+    else:
+        # pydantic-core checks the pairs are numbers.
+        pairs = _rows(v, ("x", "y"), "points with x and y")
+        points = np.asarray(_XY_PAIRS.validate_python(pairs), dtype=np.float64)
+
+    if points.size == 0:
+        return np.empty((0, 2))
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError(f"expected an (N, 2) point array, got {points.shape}")
+    return points
+
+
+def _serialize_points(points: np.ndarray):
+    return [{"x": x, "y": y} for x, y in points.tolist()]
+
+
+_INT64 = np.iinfo(np.int64)
+_OBSTACLE_ROWS = TypeAdapter(
+    List[
+        Tuple[
+            Annotated[int, Field(ge=_INT64.min, le=_INT64.max)],
+            float,
+            float,
+            float,
+            float,
+        ]
+    ]
+)
+
+
+def _validate_obstacles(v) -> np.ndarray:
+    if isinstance(v, np.ndarray):
+        return v.astype(OBSTACLE_DTYPE, copy=False)
+
+    # Ids must be whole numbers that fit the int64 column.
+    rows = _rows(v, OBSTACLE_DTYPE.names, "obstacles")
+    return np.array(_OBSTACLE_ROWS.validate_python(rows), dtype=OBSTACLE_DTYPE)
+
+
+def _serialize_obstacles(obstacles: np.ndarray):
+    return [dict(zip(OBSTACLE_DTYPE.names, row)) for row in obstacles.tolist()]
+
+
+# (N, 2) arrays of x, y, serialised as a list of Position.
+PointArray = Annotated[
+    np.ndarray,
+    PlainValidator(_validate_points),
+    PlainSerializer(_serialize_points),
+    WithJsonSchema({"type": "array", "items": Position.model_json_schema()}),
+]
+
+# Structured arrays of OBSTACLE_DTYPE, serialised as a list of ObstacleState.
+ObstacleArray = Annotated[
+    np.ndarray,
+    PlainValidator(_validate_obstacles),
+    PlainSerializer(_serialize_obstacles),
+    WithJsonSchema({"type": "array", "items": ObstacleState.model_json_schema()}),
+]
+
+
 class HLCState(BaseModel):
     speed_setpoint: float
 
-    list_rail_horizon: List[Position]
-    list_detected_object: List[Position]
-    list_trajectory_prediction: List[Position]
-    list_detected_obstacle: List[ObstacleState]
-    list_detected_railway_obstacle: List[ObstacleState]
+    list_rail_horizon: PointArray
+    list_detected_object: PointArray
+    list_trajectory_prediction: PointArray
+    list_detected_obstacle: ObstacleArray
+    list_detected_railway_obstacle: ObstacleArray
 
 
 class DMPlot(BaseModel):
@@ -84,33 +184,198 @@ class DMPlot(BaseModel):
     hlc_state: HLCState
 
 
+HISTORY_FIELDS = (
+    "t",
+    "ttc",
+    "dtc",
+    "lead_distance",
+    "safe_emergency_distance",
+    "speed_setpoint",
+    "v",
+    "current_command",
+    "fsm_state",
+)
+(
+    H_T,
+    H_TTC,
+    H_DTC,
+    H_LEAD,
+    H_SAFE,
+    H_SETPOINT,
+    H_V,
+    H_CMD,
+    H_STATE,
+) = range(len(HISTORY_FIELDS))
+
+# Figure panels that can be rendered on their own. The time-series panels
+# change with every sample; the bird's-eye view only when its points move.
+PANELS = ("ttc", "distance", "velocity", "bev")
+
+# Ten minutes at 30 Hz.
+HISTORY_SAMPLES = 18000
+# Seconds of history shown on the time axes.
+XMAX = 10.0
+
+
+class Snapshot:
+    def __init__(
+        self,
+        version: int,
+        x: float,
+        history: np.ndarray,
+        tram,
+        detected_object,
+        rail_horizon,
+        trajectory_prediction,
+    ):
+        self.version = version
+        self.x = x
+        self.history = history
+        self.tram = tram
+        self.detected_object = detected_object
+        self.rail_horizon = rail_horizon
+        self.trajectory_prediction = trajectory_prediction
+
+    @classmethod
+    def from_state(cls, version: int, s: DMPlot, history: np.ndarray):
+        hlc = s.hlc_state
+        return cls(
+            version=version,
+            x=s.tram_state.t,
+            history=history,
+            tram=([0.0, s.tram_state.x], [0.0, s.tram_state.y]),
+            detected_object=(
+                hlc.list_detected_object[:, 1],
+                hlc.list_detected_object[:, 0],
+            ),
+            rail_horizon=(
+                hlc.list_rail_horizon[:, 1],
+                hlc.list_rail_horizon[:, 0],
+            ),
+            trajectory_prediction=(
+                hlc.list_trajectory_prediction[:, 1],
+                hlc.list_trajectory_prediction[:, 0],
+            ),
+        )
+
+
+class Panel:
+    # One panel of the figure: its axes, twins included, and the artists
+    # redrawn over its cached background when blitting.
+    def __init__(self, axes, artists):
+        self.axes = axes
+        self.artists = artists
+
+
+def _points_changed(old: DMPlot, new: DMPlot) -> bool:
+    if (old.tram_state.x, old.tram_state.y) != (new.tram_state.x, new.tram_state.y):
+        return True
+    a, b = old.hlc_state, new.hlc_state
+    return not (
+        np.array_equal(a.list_detected_object, b.list_detected_object)
+        and np.array_equal(a.list_rail_horizon, b.list_rail_horizon)
+        and np.array_equal(a.list_trajectory_prediction, b.list_trajectory_prediction)
+    )
+
+
 class DMVisualisation:
     def __init__(
         self,
-        tram_state: TramState = TramState(
-            current_command=PowerLevel.N, x=0, y=0, v=0, t=0
-        ),
-        tram_state_transition: TramStateTransition = TramStateTransition(
-            fsm_state=FSMState.ACC,
-            safe_emergency_distance=15,
-            lead_distance=1000,
-            ttc=1000,
-            dtc=1000,
-            speed=1000,
-        ),
-        hlc_state: HLCState = HLCState(
-            speed_setpoint=0,
-            list_rail_horizon=[],
-            list_detected_object=[],
-            list_trajectory_prediction=[],
-            list_detected_obstacle=[],
-            list_detected_railway_obstacle=[],
-        ),
+        tram_state: TramState = None,
+        tram_state_transition: TramStateTransition = None,
+        hlc_state: HLCState = None,
+        history_samples: int = HISTORY_SAMPLES,
+        history_seconds: float = None,
+        blit: bool = False,
+        xscroll_step: float = None,
+        decimate: str = "minmax",
     ):
+        if tram_state is None:
+            tram_state = TramState(current_command=PowerLevel.N, x=0, y=0, v=0, t=0)
+        if tram_state_transition is None:
+            tram_state_transition = TramStateTransition(
+                fsm_state=FSMState.ACC,
+                safe_emergency_distance=15,
+                lead_distance=1000,
+                ttc=1000,
+                dtc=1000,
+                speed=1000,
+            )
+        if hlc_state is None:
+            hlc_state = HLCState(
+                speed_setpoint=0,
+                list_rail_horizon=[],
+                list_detected_object=[],
+                list_trajectory_prediction=[],
+                list_detected_obstacle=[],
+                list_detected_railway_obstacle=[],
+            )
+
+        self.dmplot_state = DMPlot(
+            tram_state=tram_state,
+            tram_state_transition=tram_state_transition,
+            hlc_state=hlc_state,
+        )
+
+        self.history = History(HISTORY_FIELDS, history_samples)
+        self.history_seconds = history_seconds
+
+        self.xt = [0.0]
+        self.yt = [0.0]
+        self.yo = [0.0]
+        self.xo = [0.0]
+        self.yxre = [0.0]
+        self.yyre = [0.0]
+        self.yxtp = [0.0]
+        self.yytp = [0.0]
+        self.xmin = 0
+        self.xmax = XMAX
+        self.x = 0.0
+        if self.history_seconds is None:
+            self.history_seconds = self.xmax
+
+        self.history.append([0.0] * len(HISTORY_FIELDS))
+
+        self.version = 0
+        # The state version at which each panel's inputs last changed.
+        self.panel_versions = dict.fromkeys(PANELS, 0)
+        self._frame = None
+        self._frame_version = -1
+        self._render_lock = threading.RLock()
+
+        self.blit = blit
+        self.xscroll_step = xscroll_step
+        self.client = None
+        self.decimate = decimate
+        self._reduce = REDUCERS.get(decimate)
+        self._backgrounds = None
+        self._background_key = None
+        self._boxes = None
+        self._boxes_key = None
+
+        # The figure is built on first use: sessions that are never viewed
+        # never pay for it, and startup does not import matplotlib.
+        self.fig = None
+        self._pyplot = False
+
+    def _build_figure(self, pyplot: bool = False):
+        import matplotlib
+
         font = {"size": 9}
         matplotlib.rc("font", **font)
 
-        fig = plt.figure(figsize=(18, 8))
+        if pyplot:
+            # Only the desktop client shows a window.
+            from matplotlib import pyplot as plt
+
+            fig = plt.figure(figsize=(18, 8))
+        else:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+
+            fig = Figure(figsize=(18, 8))
+            FigureCanvasAgg(fig)
+
         fig.subplots_adjust(wspace=0.5, hspace=0.3)
         fig.suptitle("Uji Otonom", fontsize=12)
         gs = fig.add_gridspec(2, 4)
@@ -175,183 +440,270 @@ class DMVisualisation:
             self.ax05,
         ]
 
-        self.dmplot_state = DMPlot(
-            tram_state=tram_state,
-            tram_state_transition=tram_state_transition,
-            hlc_state=hlc_state,
-        )
-
-        self.ystate = [0.0]
-        self.yd = [0.0]
-        self.ysd = [0.0]
-        self.yr = [0.0]
-        self.ys = [0.0]
-        self.ydbw = [0.0]
-        self.t = [0.0]
-        self.yttc = [0.0]
-        self.ydtc = [0.0]
-
-        self.xt = [0.0]
-        self.yt = [0.0]
-        self.yo = [0.0]
-        self.xo = [0.0]
-        self.yxre = [0.0]
-        self.yyre = [0.0]
-        self.yxtp = [0.0]
-        self.yytp = [0.0]
-        self.xmin = 0
-        self.xmax = 10.0
-        self.x = 0.0
-
-        (self.p011,) = self.ax01.plot(self.t, self.yttc, "c-", label="TTC")
-        (self.p012,) = self.ax012.plot(self.t, self.ydtc, "-", label="DTC")
-        (self.p021,) = self.ax02.plot(self.t, self.yd, "y-", label="distance")
-        (self.p022,) = self.ax02.plot(self.t, self.ysd, "g-", label="safe distance")
-        (self.p031,) = self.ax03.plot(self.t, self.yr, "b-", label="reference speed")
-        (self.p032,) = self.ax03.plot(self.t, self.ys, "r-", label="actual speed")
-        (self.p041,) = self.ax04.plot(self.t, self.ydbw, "m-.", label="dbw command")
-        (self.p042,) = self.ax04.plot(self.t, self.ystate, "k.-", label="state")
+        h = self.history.tail()
+        t = h[H_T]
+
+        (self.p011,) = self.ax01.plot(t, h[H_TTC], "c-", label="TTC")
+        (self.p012,) = self.ax012.plot(t, h[H_DTC], "-", label="DTC")
+        (self.p021,) = self.ax02.plot(t, h[H_LEAD], "y-", label="distance")
+        (self.p022,) = self.ax02.plot(t, h[H_SAFE], "g-", label="safe distance")
+        (self.p031,) = self.ax03.plot(t, h[H_SETPOINT], "b-", label="reference speed")
+        (self.p032,) = self.ax03.plot(t, h[H_V], "r-", label="actual speed")
+        (self.p041,) = self.ax04.plot(t, h[H_CMD], "m-.", label="dbw command")
+        (self.p042,) = self.ax04.plot(t, h[H_STATE], "k.-", label="state")
         (self.p051,) = self.ax05.plot(self.xt, self.yt, "gs", label="Tram")
         (self.p052,) = self.ax05.plot(self.xo, self.yo, "b^", label="Obstacle")
         (self.p053,) = self.ax05.plot(self.yxre, self.yyre, "g-", label="RE")
         (self.p054,) = self.ax05.plot(self.yxtp, self.yytp, "b.", label="TP")
 
-        self.ax01.legend(
+        self.l01 = self.ax01.legend(
             [self.p011, self.p012], [self.p011.get_label(), self.p012.get_label()]
         )
-        self.ax02.legend(
+        self.l02 = self.ax02.legend(
             [self.p021, self.p022], [self.p021.get_label(), self.p022.get_label()]
         )
-        self.ax03.legend(
+        self.l03 = self.ax03.legend(
             [self.p031, self.p032, self.p041],
             [self.p031.get_label(), self.p032.get_label(), self.p041.get_label()],
         )
 
-    def draw_b64(self):
-        self.xt = [0.0]
-        self.yt = [0.0]
-        self.yo = [0.0]
-        self.xo = [0.0]
-        self.yxre = [0.0]
-        self.yyre = [0.0]
-        self.yxtp = [0.0]
-        self.yytp = [0.0]
-
-        self.ystate.append(self.dmplot_state.tram_state_transition.fsm_state)
-        self.yd.append(self.dmplot_state.tram_state_transition.lead_distance)
-        self.ysd.append(self.dmplot_state.tram_state_transition.safe_emergency_distance)
-        self.yr.append(self.dmplot_state.hlc_state.speed_setpoint)
-        self.ys.append(self.dmplot_state.tram_state.v)
-        self.yttc.append(self.dmplot_state.tram_state_transition.ttc)
-        self.ydtc.append(self.dmplot_state.tram_state_transition.dtc)
-        self.yt.append(self.dmplot_state.tram_state.x)
-        self.xt.append(self.dmplot_state.tram_state.y)
-        self.ydbw.append(self.dmplot_state.tram_state.current_command)
-
-        self.x = self.dmplot_state.tram_state.t
-        self.t.append(self.x)
-
-        self.yo = [o.y for o in self.dmplot_state.hlc_state.list_detected_object]
-        self.xo = [o.x for o in self.dmplot_state.hlc_state.list_detected_object]
-        self.yyre = [o.y for o in self.dmplot_state.hlc_state.list_rail_horizon]
-        self.yxre = [o.x for o in self.dmplot_state.hlc_state.list_rail_horizon]
-        self.yytp = [
-            o.y for o in self.dmplot_state.hlc_state.list_trajectory_prediction
-        ]
-        self.yxtp = [
-            o.x for o in self.dmplot_state.hlc_state.list_trajectory_prediction
+        # Legends are redrawn after the lines so they stay on top when blitting.
+        self.panels = {
+            "ttc": Panel([self.ax01, self.ax012], [self.p011, self.p012, self.l01]),
+            "distance": Panel([self.ax02], [self.p021, self.p022, self.l02]),
+            "velocity": Panel(
+                [self.ax03, self.ax04],
+                [self.p031, self.p032, self.p041, self.p042, self.l03],
+            ),
+            "bev": Panel([self.ax05], [self.p051, self.p052, self.p053, self.p054]),
+        }
+        self.animated_artists = [
+            artist for panel in self.panels.values() for artist in panel.artists
         ]
 
-        self.p011.set_data(self.t, self.yttc)
-        self.p011.set_data(self.t, self.ydtc)
-        self.p021.set_data(self.t, self.yd)
-        self.p022.set_data(self.t, self.ysd)
-        self.p031.set_data(self.t, self.yr)
-        self.p032.set_data(self.t, self.ys)
-        self.p041.set_data(self.t, self.ydbw)
-        self.p042.set_data(self.t, self.ystate)
-        self.p051.set_data(self.yt, self.xt)
-        self.p052.set_data(self.yo, self.xo)
-        self.p053.set_data(self.yyre, self.yxre)
-        self.p054.set_data(self.yytp, self.yxtp)
+        self._pyplot = pyplot
+        self._backgrounds = None
+        for artist in self.animated_artists:
+            artist.set_animated(self.blit)
+
+    def _ensure_figure(self):
+        if self.fig is None:
+            self._build_figure()
+
+    def _sample(self):
+        s = self.dmplot_state
+        return (
+            s.tram_state.t,
+            s.tram_state_transition.ttc,
+            s.tram_state_transition.dtc,
+            s.tram_state_transition.lead_distance,
+            s.tram_state_transition.safe_emergency_distance,
+            s.hlc_state.speed_setpoint,
+            s.tram_state.v,
+            s.tram_state.current_command,
+            s.tram_state_transition.fsm_state,
+        )
+
+    def append_sample(self):
+        self.history.append(self._sample())
+
+    def snapshot(self, copy: bool = False):
+        s = self.dmplot_state
+        history = self.history.since(s.tram_state.t - self.history_seconds)
+        return Snapshot.from_state(
+            self.version, s, history.copy() if copy else history
+        )
 
+    def apply_snapshot(self, snapshot):
+        self._ensure_figure()
+        self.x = snapshot.x
+        h = snapshot.history
+        t = h[H_T]
+
+        self.p011.set_data(*self._decimate(self.p011, t, h[H_TTC]))
+        self.p012.set_data(*self._decimate(self.p012, t, h[H_DTC]))
+        self.p021.set_data(*self._decimate(self.p021, t, h[H_LEAD]))
+        self.p022.set_data(*self._decimate(self.p022, t, h[H_SAFE]))
+        self.p031.set_data(*self._decimate(self.p031, t, h[H_SETPOINT]))
+        self.p032.set_data(*self._decimate(self.p032, t, h[H_V]))
+        self.p041.set_data(*self._decimate(self.p041, t, h[H_CMD]))
+        self.p042.set_data(*self._decimate(self.p042, t, h[H_STATE]))
+        self.p051.set_data(*snapshot.tram)
+        self.p052.set_data(*snapshot.detected_object)
+        self.p053.set_data(*snapshot.rail_horizon)
+        self.p054.set_data(*snapshot.trajectory_prediction)
+
+        # Always set the limits: a pooled figure renders many sessions.
         if self.x >= self.xmax - 1.00:
-            self.p011.axes.set_xlim(self.x - self.xmax + 1.0, self.x + 1.0)
-            self.p021.axes.set_xlim(self.x - self.xmax + 1.0, self.x + 1.0)
-            self.p032.axes.set_xlim(self.x - self.xmax + 1.0, self.x + 1.0)
-            self.p041.axes.set_xlim(self.x - self.xmax + 1.0, self.x + 1.0)
+            right = self.x + 1.0
+            if self.xscroll_step:
+                # Scroll in whole steps so blitted backgrounds stay valid
+                # between steps.
+                right = math.ceil(right / self.xscroll_step) * self.xscroll_step
+            left = right - self.xmax
+        else:
+            left, right = 0.0, self.xmax
+        self.p011.axes.set_xlim(left, right)
+        self.p021.axes.set_xlim(left, right)
+        self.p032.axes.set_xlim(left, right)
+        self.p041.axes.set_xlim(left, right)
+
+    def _decimate(self, line, t, y):
+        if self._reduce is None:
+            return t, y
+        # Sized to the pixel width of the axes: more points than that only
+        # cost transform and clipping time.
+        return self._reduce(t, y, int(line.axes.bbox.width))
+
+    def _limits_key(self):
+        return (
+            tuple(self.fig.bbox.bounds),
+            tuple((ax.get_xlim(), ax.get_ylim()) for ax in self.all_axes),
+        )
 
-        buf = BytesIO()
-        self.fig.savefig(buf, format="png")
-        data = base64.b64encode(buf.getbuffer()).decode("ascii")
+    def draw_blit(self, panel: str = None):
+        canvas = self.fig.canvas
+        names = PANELS if panel is None else (panel,)
+        key = self._limits_key()
+        if key != self._background_key:
+            # Full draw skips the animated artists, leaving only the static
+            # background to cache.
+            canvas.draw()
+            self._backgrounds = {
+                name: canvas.copy_from_bbox(p.axes[0].bbox)
+                for name, p in self.panels.items()
+            }
+            self._background_key = key
+        else:
+            for name in names:
+                canvas.restore_region(self._backgrounds[name])
+
+        for name in names:
+            for artist in self.panels[name].artists:
+                self.fig.draw_artist(artist)
+
+    def _panel_bbox(self, panel: str):
+        # Display-space box around a panel's axes with their titles, tick
+        # labels and legends, kept while the limits and size stay the same.
+        from matplotlib.transforms import Bbox
+
+        key = self._limits_key()
+        if key != self._boxes_key:
+            renderer = self.fig.canvas.get_renderer()
+            self._boxes = {}
+            for name, p in self.panels.items():
+                box = Bbox.union([ax.get_tightbbox(renderer) for ax in p.axes])
+                self._boxes[name] = Bbox.intersection(box.padded(4), self.fig.bbox)
+            self._boxes_key = key
+        return self._boxes[panel]
+
+    def _crop(self, rgba, panel: str):
+        box = self._panel_bbox(panel)
+        height = rgba.shape[0]
+        # Display coordinates start at the bottom; buffer rows at the top.
+        return rgba[
+            height - math.ceil(box.y1) : height - int(box.y0),
+            int(box.x0) : math.ceil(box.x1),
+        ]
 
-        return data
+    def update_artists(self):
+        self.apply_snapshot(self.snapshot())
+
+    def render_snapshot(self, snapshot, profile=None, panel: str = None) -> bytes:
+        profile = PROFILES[profile or DEFAULT_PROFILE]
+        with self._render_lock:
+            self.apply_snapshot(snapshot)
+            if self.fig.get_dpi() != profile.dpi:
+                # Changes the canvas size, so blit backgrounds are recaptured.
+                self.fig.set_dpi(profile.dpi)
+
+            if profile.vector:
+                # Blitted artists are animated, which savefig would skip.
+                for artist in self.animated_artists:
+                    artist.set_animated(False)
+                bbox_inches = None
+                if panel is not None:
+                    bbox_inches = self._panel_bbox(panel).transformed(
+                        self.fig.dpi_scale_trans.inverted()
+                    )
+                try:
+                    return profile.encode_figure(self.fig, bbox_inches)
+                finally:
+                    for artist in self.animated_artists:
+                        artist.set_animated(self.blit)
+                    self._background_key = None
+
+            if self.blit:
+                self.draw_blit(panel)
+            else:
+                self.fig.canvas.draw()
+            rgba = np.asarray(self.fig.canvas.buffer_rgba())
+            if panel is not None:
+                rgba = self._crop(rgba, panel)
+            return profile.encode_rgba(rgba)
+
+    def render(self, profile=None, panel: str = None):
+        with self._render_lock:
+            snapshot = self.snapshot()
+            return snapshot.version, self.render_snapshot(snapshot, profile, panel)
+
+    def draw_b64(self):
+        # Polling clients share one encoded frame per state version.
+        with self._render_lock:
+            if self._frame_version != self.version:
+                version, png = self.render()
+                self._frame = base64.b64encode(png).decode("ascii")
+                self._frame_version = version
+
+            return self._frame
+
+    def memory_bytes(self):
+        # History plus the Agg canvas and its cached blit backgrounds.
+        if self.fig is None:
+            return self.history.nbytes
+        width, height = self.fig.canvas.get_width_height()
+        canvas = width * height * 4
+        return self.history.nbytes + canvas * (2 if self.blit else 1)
+
+    def close(self):
+        if self.client is not None:
+            self.client.stop()
+        if self._pyplot:
+            from matplotlib import pyplot as plt
+
+            plt.close(self.fig)
+        self.fig = None
 
     def update_dmplot_state(self, curr: DMPlot):
+        previous = self.dmplot_state
         self.dmplot_state = curr
+        self.append_sample()
+        self.version += 1
 
-    def get_dmplot_state(self):
-        r = requests.get("http://localhost:8000/dmvis_data")
+        for name in ("ttc", "distance", "velocity"):
+            self.panel_versions[name] = self.version
+        if _points_changed(previous, curr):
+            self.panel_versions["bev"] = self.version
 
-        j = r.json()
+    def connect(self, url: str = None):
+        # Fetching runs on the client's thread, so a slow server never
+        # stalls the animation; it just draws the newest state it has.
+        from client import DMVIS_DATA_URL, DMPlotClient
 
-        self.update_dmplot_state(j)
-
-    def mpl_func_animation_cb(self, frame):
-        self.get_dmplot_state()
-
-        self.xt = [0.0]
-        self.yt = [0.0]
-        self.yo = [0.0]
-        self.xo = [0.0]
-        self.yxre = [0.0]
-        self.yyre = [0.0]
-        self.yxtp = [0.0]
-        self.yytp = [0.0]
+        self.client = DMPlotClient(url or DMVIS_DATA_URL)
+        self.client.start()
 
-        self.ystate.append(self.dmplot_state.tram_state_transition.fsm_state)
-        self.yd.append(self.dmplot_state.tram_state_transition.lead_distance)
-        self.ysd.append(self.dmplot_state.tram_state_transition.safe_emergency_distance)
-        self.yr.append(self.dmplot_state.hlc_state.speed_setpoint)
-        self.ys.append(self.dmplot_state.tram_state.v)
-        self.yttc.append(self.dmplot_state.tram_state_transition.ttc)
-        self.ydtc.append(self.dmplot_state.tram_state_transition.dtc)
-        self.yt.append(self.dmplot_state.tram_state.x)
-        self.xt.append(self.dmplot_state.tram_state.y)
-        self.ydbw.append(self.dmplot_state.tram_state.current_command)
-
-        self.x = self.dmplot_state.tram_state.t
-        self.t.append(self.x)
-
-        self.yo = [o.y for o in self.dmplot_state.hlc_state.list_detected_object]
-        self.xo = [o.x for o in self.dmplot_state.hlc_state.list_detected_object]
-        self.yyre = [o.y for o in self.dmplot_state.hlc_state.list_rail_horizon]
-        self.yxre = [o.x for o in self.dmplot_state.hlc_state.list_rail_horizon]
-        self.yytp = [
-            o.y for o in self.dmplot_state.hlc_state.list_trajectory_prediction
-        ]
-        self.yxtp = [
-            o.x for o in self.dmplot_state.hlc_state.list_trajectory_prediction
-        ]
+    def get_dmplot_state(self):
+        if self.client is None:
+            self.connect()
 
-        self.p011.set_data(self.t, self.yttc)
-        self.p011.set_data(self.t, self.ydtc)
-        self.p021.set_data(self.t, self.yd)
-        self.p022.set_data(self.t, self.ysd)
-        self.p031.set_data(self.t, self.yr)
-        self.p032.set_data(self.t, self.ys)
-        self.p041.set_data(self.t, self.ydbw)
-        self.p042.set_data(self.t, self.ystate)
-        self.p051.set_data(self.yt, self.xt)
-        self.p052.set_data(self.yo, self.xo)
-        self.p053.set_data(self.yyre, self.yxre)
-        self.p054.set_data(self.yytp, self.yxtp)
+        p = self.client.take()
+        if p is not None:
+            self.update_dmplot_state(p)
 
-        if self.x >= self.xmax - 1.00:
-            self.p011.axes.set_xlim(self.x - self.xmax + 1.0, self.x + 1.0)
-            self.p021.axes.set_xlim(self.x - self.xmax + 1.0, self.x + 1.0)
-            self.p032.axes.set_xlim(self.x - self.xmax + 1.0, self.x + 1.0)
-            self.p041.axes.set_xlim(self.x - self.xmax + 1.0, self.x + 1.0)
+    def mpl_func_animation_cb(self, frame):
+        self.get_dmplot_state()
+        self.update_artists()
 
         return (
             self.p011,
@@ -361,6 +713,7 @@ class DMVisualisation:
             self.p031,
             self.p032,
             self.p041,
+            self.p042,
             self.p051,
             self.p052,
             self.p053,
@@ -368,6 +721,11 @@ class DMVisualisation:
         )
 
     def show(self):
+        import matplotlib.animation as animation
+        from matplotlib import pyplot as plt
+
+        if not self._pyplot:
+            self._build_figure(pyplot=True)
         self.simulation = animation.FuncAnimation(
             self.fig, self.mpl_func_animation_cb, blit=False, interval=20, repeat=False
         )
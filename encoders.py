@@ -0,0 +1,63 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# Render profiles pick a resolution and an encoder per request. Raster
+# encoders read the Agg canvas buffer directly; only vector output goes
+# through savefig.
+
+MEDIA_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "svg": "image/svg+xml",
+}
+
+
+class Profile:
+    def __init__(self, name: str, format: str = "png", dpi: float = 100, **options):
+        self.name = name
+        self.format = format
+        self.dpi = dpi
+        # Passed to PIL's save for raster formats.
+        self.options = options
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.format]
+
+    @property
+    def vector(self) -> bool:
+        return self.format == "svg"
+
+    def encode_rgba(self, rgba) -> bytes:
+        rgba = np.asarray(rgba)
+        if self.format == "jpeg":
+            # No alpha in JPEG; the figure background is opaque anyway.
+            rgba = rgba[..., :3]
+        buf = BytesIO()
+        Image.fromarray(rgba).save(buf, format=self.format, **self.options)
+        return buf.getvalue()
+
+    def encode_figure(self, fig, bbox_inches=None) -> bytes:
+        buf = BytesIO()
+        fig.savefig(buf, format=self.format, dpi=self.dpi, bbox_inches=bbox_inches)
+        return buf.getvalue()
+
+
+PROFILES = {
+    p.name: p
+    for p in (
+        # Full size at the old default look, but with fast zlib settings.
+        Profile("png", "png", dpi=100, compress_level=1),
+        # Small and cheap to encode, for tablets on the live stream.
+        Profile("live", "jpeg", dpi=60, quality=80),
+        # Smallest on the wire, at some encode cost.
+        Profile("webp", "webp", dpi=60, quality=75, method=0),
+        Profile("report", "png", dpi=200, compress_level=6),
+        Profile("svg", "svg", dpi=100),
+    )
+}
+
+DEFAULT_PROFILE = "png"
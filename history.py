@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class History:
+    def __init__(self, fields, capacity: int):
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self.index = {name: i for i, name in enumerate(self.fields)}
+
+        # Each sample is written twice, `capacity` columns apart, so the newest
+        # `capacity` samples always form one contiguous slice of the buffer.
+        self._buf = np.zeros((len(self.fields), 2 * capacity))
+        self._head = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        return self._buf.nbytes
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+
+    def append(self, values):
+        self._buf[:, self._head] = values
+        self._buf[:, self._head + self.capacity] = values
+        self._head = (self._head + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def tail(self, n: int = None):
+        if n is None or n > self._size:
+            n = self._size
+        end = self._head + self.capacity
+        return self._buf[:, end - n : end]
+
+    def since(self, t0: float, field: str = "t"):
+        view = self.tail()
+        start = np.searchsorted(view[self.index[field]], t0, side="left")
+        return view[:, start:]
+
+    def latest(self):
+        if self._size == 0:
+            return None
+        return self._buf[:, self._head + self.capacity - 1]
@@ -0,0 +1,48 @@
+import asyncio
+
+from delta import DeltaLog
+
+
+class StateHub:
+    def __init__(self):
+        self.subscribers = set()
+        self.message = None
+        self.version = 0
+        self.dropped = 0
+        self.deltas = DeltaLog()
+        self._changed = asyncio.Event()
+
+    def subscribe(self) -> asyncio.Queue:
+        # One slot per subscriber: a slow client skips to the newest state
+        # instead of building a backlog.
+        queue = asyncio.Queue(maxsize=1)
+        if self.message is not None:
+            queue.put_nowait(self.message)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    async def wait_newer(self, since: int, timeout: float) -> bool:
+        # A `since` ahead of us is from before a restart; answer at once.
+        if self.version != since:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def publish(self, version: int, state):
+        self.message = f'{{"version":{version},"state":{state.model_dump_json()}}}'
+        self.version = version
+        self.deltas.record(version, state)
+        # Wake every long-poll waiting on the old event.
+        self._changed.set()
+        self._changed = asyncio.Event()
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(self.message)
@@ -0,0 +1,284 @@
+import argparse
+import asyncio
+import itertools
+import json
+import re
+import threading
+import time
+
+import httpx
+import numpy as np
+
+# Drives POST /dmvis at a fixed rate while simulated htmx viewers poll the
+# plot and debug fragments, then prints a JSON report. Without --url the
+# app is started in-process on a free local port.
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 33, 50, 100, 200, 500, 1000, 2000)
+
+VERSION_RE = re.compile(rb"dmvis\.png\?v=([0-9a-f]+-\d+)")
+
+
+class Endpoint:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+
+    def record(self, latency: float, status: int = None):
+        if status is None or status >= 400:
+            self.errors += 1
+        if status is not None:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.latencies.append(latency)
+
+    def report(self, elapsed: float) -> dict:
+        ms = np.asarray(self.latencies) * 1e3
+        report = {
+            "requests": len(ms),
+            "errors": self.errors,
+            "statuses": {str(k): v for k, v in sorted(self.statuses.items())},
+            "rate_per_s": len(ms) / elapsed,
+        }
+        if len(ms):
+            p50, p90, p99 = np.percentile(ms, (50, 90, 99))
+            counts, _ = np.histogram(ms, bins=(0,) + LATENCY_BUCKETS_MS + (np.inf,))
+            report["latency_ms"] = {
+                "mean": float(ms.mean()),
+                "p50": float(p50),
+                "p90": float(p90),
+                "p99": float(p99),
+                "max": float(ms.max()),
+            }
+            report["latency_histogram_ms"] = {
+                f"<={le}": int(c) for le, c in zip(LATENCY_BUCKETS_MS, counts)
+            }
+            report["latency_histogram_ms"]["inf"] = int(counts[-1])
+        return report
+
+
+async def timed(endpoint: Endpoint, request):
+    tic = time.perf_counter()
+    try:
+        r = await request
+    except httpx.HTTPError:
+        endpoint.record(time.perf_counter() - tic)
+        return None
+    endpoint.record(time.perf_counter() - tic, r.status_code)
+    return r
+
+
+async def produce(client, endpoint, bodies, content_type, rate, concurrency, until):
+    # Open loop: frames are due on a fixed schedule whatever the server's
+    # latency, up to `concurrency` requests in flight.
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+    late = 0
+    start = time.perf_counter()
+
+    headers = {"content-type": content_type}
+
+    async def post(body):
+        try:
+            await timed(endpoint, client.post("/dmvis", content=body, headers=headers))
+        finally:
+            slots.release()
+
+    for k, body in enumerate(bodies):
+        due = start + k / rate
+        now = time.perf_counter()
+        if due >= until:
+            break
+        if due > now:
+            await asyncio.sleep(due - now)
+        await slots.acquire()
+        if time.perf_counter() - due > 1.0 / rate:
+            late += 1
+        task = asyncio.create_task(post(body))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.wait(tasks)
+    return late
+
+
+async def view(base_url, prefix, profile, plot, png, debug, interval, until):
+    # One browser tab: its own connections, polling both fragments every
+    # `interval` and fetching the image only when its URL changes. Like a
+    # browser, it revalidates the debug fragment with its last ETag.
+    params = {"profile": profile} if profile else {}
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        version = None
+        debug_etag = None
+        while time.perf_counter() < until:
+            tic = time.perf_counter()
+            headers = {"if-none-match": debug_etag} if debug_etag else {}
+            r, d = await asyncio.gather(
+                timed(plot, client.get(f"{prefix}/dmvis", params=params)),
+                timed(debug, client.get(f"{prefix}/dmvisdebug", headers=headers)),
+            )
+            if d is not None and d.status_code == 200:
+                debug_etag = d.headers.get("etag")
+            if r is not None:
+                m = VERSION_RE.search(r.content)
+                if m and m.group(1).decode() != version:
+                    version = m.group(1).decode()
+                    url = f"{prefix}/dmvis.png"
+                    await timed(png, client.get(url, params={"v": version, **params}))
+            await asyncio.sleep(max(0.0, interval - (time.perf_counter() - tic)))
+
+
+def frame_bodies(args):
+    import wire
+    from dmvis import DMPlot
+    from synth import DMPlotGenerator
+
+    if args.files:
+        frames = [json.load(open(path)) for path in args.files]
+        frames = itertools.cycle(frames)
+    else:
+        generator = DMPlotGenerator(
+            rail_horizon=args.rail_horizon,
+            obstacles=args.obstacles,
+            railway_obstacles=args.railway_obstacles,
+            rate=args.rate,
+            seed=args.seed,
+        )
+        frames = (generator.frame(i) for i in itertools.count())
+
+    for f in frames:
+        if args.format == "wire":
+            yield wire.encode(DMPlot.model_validate(f))
+        else:
+            yield json.dumps(f).encode()
+
+
+def start_server():
+    import uvicorn
+
+    import main
+
+    server = uvicorn.Server(
+        uvicorn.Config(main.app, host="127.0.0.1", port=0, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+async def run(args, base_url):
+    import wire
+
+    content_type = wire.MEDIA_TYPE if args.format == "wire" else "application/json"
+    prefix = f"/sessions/{args.session}" if args.session else ""
+    bodies = frame_bodies(args)
+    if args.count is not None:
+        bodies = itertools.islice(bodies, args.count)
+
+    ingest = Endpoint("POST /dmvis")
+    plot = Endpoint("GET /dmvis")
+    png = Endpoint("GET /dmvis.png")
+    debug = Endpoint("GET /dmvisdebug")
+
+    start = time.perf_counter()
+    until = start + args.duration
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url + prefix, limits=limits) as client:
+        producers = [
+            produce(
+                client,
+                ingest,
+                bodies,
+                content_type,
+                args.rate / args.producers,
+                args.concurrency,
+                until,
+            )
+            for _ in range(args.producers)
+        ]
+        viewers = [
+            view(
+                base_url,
+                prefix,
+                args.profile,
+                plot,
+                png,
+                debug,
+                args.view_interval,
+                until,
+            )
+            for _ in range(args.viewers)
+        ]
+        results = await asyncio.gather(*producers, *viewers)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "url": base_url + prefix,
+        "params": vars(args),
+        "elapsed_s": elapsed,
+        "late_frames": sum(results[: args.producers]),
+        "endpoints": {
+            e.name: e.report(elapsed) for e in (ingest, plot, png, debug) if e.latencies
+        },
+    }
+
+
+def main():
+    from dmvis import DMPlot
+
+    parser = argparse.ArgumentParser(
+        description="Load the DMVis server with producers and polling viewers."
+    )
+    parser.add_argument("--url", help="target server (default: start one in-process)")
+    parser.add_argument("--session", help="post and view under /sessions/<id>")
+    parser.add_argument("--rate", type=float, default=100.0, help="frames per second")
+    parser.add_argument("--producers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--count", type=int, help="stop after this many frames")
+    parser.add_argument("--format", choices=("json", "wire"), default="json")
+    parser.add_argument("--files", nargs="+", help="post these JSON frames in turn")
+    parser.add_argument("--rail-horizon", type=int, default=31)
+    parser.add_argument("--obstacles", type=int, default=1)
+    parser.add_argument("--railway-obstacles", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--viewers", type=int, default=0)
+    parser.add_argument("--view-interval", type=float, default=0.033)
+    parser.add_argument("--profile", help="render profile the viewers ask for")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    # Catch files that are not frames before they turn into a run of 422s.
+    for path in args.files or ():
+        try:
+            with open(path) as f:
+                DMPlot.model_validate(json.load(f))
+        except (OSError, ValueError) as e:
+            parser.error(f"{path} is not a DMPlot frame:\n{e}")
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server, thread, base_url = start_server()
+
+    try:
+        report = asyncio.run(run(args, base_url.rstrip("/")))
+    finally:
+        if server is not None:
+            server.should_exit = True
+            thread.join()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
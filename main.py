@@ -1,19 +1,100 @@
+import os
 import pathlib
-from typing import Annotated, List
+import re
+import secrets
+from contextlib import asynccontextmanager
+from typing import Annotated, Dict, List
 
-from fastapi import FastAPI, Request, Response, Form
+from fastapi import (
+    APIRouter,
+    Depends,
+    FastAPI,
+    Form,
+    HTTPException,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+    WebSocketException,
+    status,
+)
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 
-from pydantic import BaseModel, Json
+from pydantic import BaseModel, Json, TypeAdapter, ValidationError
+from starlette.requests import HTTPConnection
 
 from io import BytesIO
 import base64
+import gzip
 
 import time
 
-from dmvis import DMPlot, DMVisualisation, TramState
+# The server only ever renders off-screen; never let matplotlib probe for a
+# GUI backend, even if something imports pyplot.
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from dmvis import PANELS, XMAX, DMPlot, DMVisualisation, TramState
+from encoders import DEFAULT_PROFILE, PROFILES
+from hub import StateHub
+from metrics import (
+    CONTENT_TYPE,
+    REGISTRY,
+    REQUEST_SECONDS,
+    VALIDATION_SECONDS,
+    Counter,
+    Gauge,
+    MetricsMiddleware,
+)
+from recorder import FlightRecorder, Recording
+from replay import Replay, snapshot_at
+from renderer import Figures, RenderPool, RenderWorker
+from sessions import SessionStore
+from stats import RollingStats
+import delta
+import wire
+
+RENDER_FPS = float(os.environ.get("DMVIS_RENDER_FPS", "30"))
+# A session's render loop pauses after this long without an image request and
+# resumes on the next one; 0 keeps it running.
+RENDER_IDLE_S = float(os.environ.get("DMVIS_RENDER_IDLE_S", "10")) or None
+RENDER_BLIT = os.environ.get("DMVIS_RENDER_BLIT", "1") == "1"
+RENDER_PROCESSES = int(os.environ.get("DMVIS_RENDER_PROCESSES", "0"))
+RENDER_XSCROLL_STEP = 1.0 if RENDER_BLIT else None
+# "minmax", "lttb" or "none": how history lines are thinned to the axes width.
+RENDER_DECIMATE = os.environ.get("DMVIS_RENDER_DECIMATE", "minmax")
+# The profile the render loop keeps current; see encoders.PROFILES. Others
+# are rendered when a viewer asks for them with ?profile=.
+RENDER_PROFILE = os.environ.get("DMVIS_RENDER_PROFILE", DEFAULT_PROFILE)
+if RENDER_PROFILE not in PROFILES:
+    raise ValueError(f"DMVIS_RENDER_PROFILE must be one of {', '.join(PROFILES)}")
+# How often the /panels page refreshes each panel; override with ?every=.
+PANEL_REFRESH_MS = {"ttc": 200, "distance": 200, "velocity": 200, "bev": 33}
+# Longest an image request waits for a session's first frame before a 503.
+FRAME_TIMEOUT_S = float(os.environ.get("DMVIS_FRAME_TIMEOUT_S", "5"))
+# Longest a GET /dmvis_data?since= waits for a newer state.
+LONGPOLL_TIMEOUT_S = float(os.environ.get("DMVIS_LONGPOLL_TIMEOUT_S", "25"))
+# Longest line POST /dmvis/stream buffers while waiting for its newline.
+STREAM_MAX_LINE_BYTES = int(os.environ.get("DMVIS_STREAM_MAX_LINE_BYTES", 1 << 20))
+SESSION_MEMORY_MB = float(os.environ.get("DMVIS_SESSION_MEMORY_MB", "512"))
+SESSION_IDLE_S = float(os.environ.get("DMVIS_SESSION_IDLE_S", "600"))
+DEFAULT_SESSION = "default"
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# When set, every ingested frame is also appended to a recording in this
+# directory, one file per session.
+RECORD_DIR = os.environ.get("DMVIS_RECORD_DIR")
+
+
+def record_path(name: str) -> str:
+    # Resolved, and refused if it would land outside RECORD_DIR.
+    root = os.path.realpath(RECORD_DIR)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.dirname(path) != root:
+        raise ValueError(f"{name!r} is not a file in {RECORD_DIR}")
+    return path
+
 
 class CANTramStatus(BaseModel):
     speed: float
@@ -27,21 +108,298 @@ class TramCan(BaseModel):
 
 class ProcessingTime(BaseModel):
     duration: int
+    # Optional per-stage durations of the same decision-loop iteration.
+    stages: Dict[str, int] = {}
+
+
+# Stages beyond this many distinct names are not tracked.
+MDI_MAX_STAGES = 32
 
 
 class MoreDebugInfo:
     def __init__(self):
         self.proctime = ProcessingTime(duration=0)
+        self.duration = RollingStats()
+        self.stages = {}
 
     def update(self, curr_proc_time: ProcessingTime):
-        self.proctime.duration = curr_proc_time.duration
+        self.proctime = curr_proc_time
+        now = time.monotonic()
+        self.duration.add(now, curr_proc_time.duration)
+        for name, duration in curr_proc_time.stages.items():
+            stats = self.stages.get(name)
+            if stats is None:
+                if len(self.stages) >= MDI_MAX_STAGES:
+                    continue
+                stats = self.stages[name] = RollingStats()
+            stats.add(now, duration)
+
+    def summary(self):
+        return {
+            "duration": self.duration.summary(),
+            "stages": {name: s.summary() for name, s in self.stages.items()},
+        }
+
+
+# With DMVIS_RENDER_PROCESSES > 0, sessions render in worker processes that
+# each own a figure; otherwise every session renders its own figure in-process.
+render_pool = None
+if RENDER_PROCESSES > 0:
+    render_pool = RenderPool(
+        RENDER_PROCESSES, RENDER_BLIT, RENDER_XSCROLL_STEP, RENDER_DECIMATE
+    )
+
+
+class RenderedFragment:
+    def __init__(self, etag: str, version: int, body: bytes):
+        self.etag = etag
+        self.version = version
+        self.body = body
+        self._gzip = None
+
+    @property
+    def gzip(self):
+        # Compressed on the first request that accepts it, then reused.
+        if self._gzip is None:
+            self._gzip = gzip.compress(self.body, compresslevel=6, mtime=0)
+        return self._gzip
+
+
+class Session:
+    def __init__(self, session_id: str):
+        self.id = session_id
+        if session_id == DEFAULT_SESSION:
+            self.prefix = ""
+        else:
+            self.prefix = f"/sessions/{session_id}"
+
+        self.dmvis = DMVisualisation(
+            blit=RENDER_BLIT,
+            xscroll_step=RENDER_XSCROLL_STEP,
+            decimate=RENDER_DECIMATE,
+        )
+        self.mdi = MoreDebugInfo()
+        self.tramcan = TramCan()
+        self.renderer = RenderWorker(
+            self.dmvis,
+            fps=RENDER_FPS,
+            pool=render_pool,
+            name=session_id,
+            profile=RENDER_PROFILE,
+            idle_s=RENDER_IDLE_S,
+        )
+        self.hub = StateHub()
+
+        self.recorder = None
+        if RECORD_DIR:
+            # The ID is part of the file name.
+            if not SESSION_ID_RE.match(session_id):
+                raise ValueError(f"invalid session ID {session_id!r}")
+            os.makedirs(RECORD_DIR, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            path = record_path(f"{session_id}-{stamp}.dmrec")
+            self.recorder = FlightRecorder(path)
+        self.replay = None
+        self.ingested = 0
+        # Versions restart at 0 with the process or a re-created session.
+        # Image URLs and ETags carry this too, so a page left open across a
+        # restart never gets a cached frame from the previous run.
+        self.epoch = secrets.token_hex(4)
+        # The /dmvisdebug fragment for the latest state version it was asked
+        # for, shared by every polling viewer.
+        self.debug_fragment = None
+
+    def ingest(self, p: DMPlot, record: bool = True):
+        if record and self.recorder is not None:
+            self.recorder.record(p)
+        self.dmvis.update_dmplot_state(p)
+        self.ingested += 1
+        self.hub.publish(self.dmvis.version, p)
+        # Long streams and replays ingest without new requests.
+        sessions.touch(self.id)
+
+    def ingest_many(self, ps: List[DMPlot]):
+        # Every frame goes into the history, but subscribers only need the
+        # newest one.
+        for p in ps:
+            if self.recorder is not None:
+                self.recorder.record(p)
+            self.dmvis.update_dmplot_state(p)
+        self.ingested += len(ps)
+        if ps:
+            self.hub.publish(self.dmvis.version, ps[-1])
+            sessions.touch(self.id)
+
+    def memory_bytes(self):
+        return self.dmvis.memory_bytes() + self.renderer.memory_bytes()
+
+    def start(self):
+        self.renderer.start()
+
+    def close(self):
+        if self.replay is not None:
+            self.replay.stop()
+        self.renderer.stop()
+        self.dmvis.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+
+sessions = SessionStore(
+    Session,
+    max_bytes=int(SESSION_MEMORY_MB * 1024 * 1024),
+    idle_timeout=SESSION_IDLE_S,
+    pinned=[DEFAULT_SESSION],
+)
+
+
+def session_error(conn: HTTPConnection, status_code: int, detail: str):
+    if conn.scope["type"] == "websocket":
+        return WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=detail)
+    return HTTPException(status_code=status_code, detail=detail)
+
+
+def session_id_of(conn: HTTPConnection) -> str:
+    # Routes at the root serve the default session; only the
+    # /sessions/{session_id} mount names another one.
+    session_id = conn.path_params.get("session_id", DEFAULT_SESSION)
+    if not SESSION_ID_RE.match(session_id):
+        raise session_error(conn, 404, "no such session")
+    return session_id
+
+
+def get_session(conn: HTTPConnection) -> Session:
+    # Reading never creates a session, so a mistyped URL can't start a
+    # render thread and a recording.
+    session = sessions.get(session_id_of(conn), create=False)
+    if session is None:
+        raise session_error(conn, 404, "no such session")
+    return session
+
+
+def create_session(conn: HTTPConnection) -> Session:
+    # For routes that feed a session, which create it on first use.
+    return sessions.get(session_id_of(conn))
+
+
+# Per-session values are read from the sessions at scrape time, so evicted
+# sessions drop out of /metrics.
+def per_session(value):
+    return lambda: {(s.id,): value(s) for s in sessions.values()}
+
+
+def frames_dropped():
+    dropped = {}
+    for s in sessions.values():
+        dropped[(s.id, "render")] = s.renderer.skipped
+        dropped[(s.id, "subscriber")] = s.hub.dropped
+        if s.recorder is not None:
+            dropped[(s.id, "recorder")] = s.recorder.dropped
+    return dropped
+
+
+Counter(
+    "dmvis_frames_ingested_total",
+    "Frames ingested.",
+    ["session"],
+    function=per_session(lambda s: s.ingested),
+)
+Counter(
+    "dmvis_render_failures_total",
+    "Renders that raised; the render loop logs them and carries on.",
+    ["session"],
+    function=per_session(lambda s: s.renderer.failed),
+)
+Counter(
+    "dmvis_frames_rendered_total",
+    "Frames rendered.",
+    ["session"],
+    function=per_session(lambda s: s.renderer.rendered),
+)
+Counter(
+    "dmvis_frames_dropped_total",
+    "Frames dropped: superseded before rendering, skipped by a slow "
+    "subscriber, or not recorded.",
+    ["session", "stage"],
+    function=frames_dropped,
+)
+Gauge(
+    "dmvis_history_samples",
+    "Samples held in the history buffer.",
+    ["session"],
+    function=per_session(lambda s: len(s.dmvis.history)),
+)
+Gauge(
+    "dmvis_history_capacity",
+    "Capacity of the history buffer in samples.",
+    ["session"],
+    function=per_session(lambda s: s.dmvis.history.capacity),
+)
+Gauge(
+    "dmvis_history_bytes",
+    "Memory held by the history buffer.",
+    ["session"],
+    function=per_session(lambda s: s.dmvis.history.nbytes),
+)
+Gauge(
+    "dmvis_session_memory_bytes",
+    "Estimated memory held by a session.",
+    ["session"],
+    function=per_session(lambda s: s.memory_bytes()),
+)
+Gauge(
+    "dmvis_tram_speed",
+    "Last tram speed reported over CAN.",
+    ["session"],
+    function=per_session(lambda s: s.tramcan.speed),
+)
+
+
+def open_recording(name: str) -> Recording:
+    if not RECORD_DIR or os.path.basename(name) != name or not name.endswith(".dmrec"):
+        raise HTTPException(status_code=404, detail="no such recording")
+    try:
+        path = record_path(name)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="no such recording")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="no such recording")
+    recording = Recording(path)
+    if len(recording) == 0:
+        raise HTTPException(status_code=404, detail="recording is empty")
+    return recording
 
 
-dmvis = DMVisualisation()
-mdi = MoreDebugInfo()
-tramcan = TramCan()
+# Renders recorded frames for scrubbing when there is no render pool.
+scrub_figures = None
 
-app = FastAPI()
+
+def render_scrub(snapshot, profile: str = None) -> bytes:
+    global scrub_figures
+    if render_pool is not None:
+        return render_pool.render(snapshot, profile)
+    if scrub_figures is None:
+        scrub_figures = Figures(RENDER_BLIT, RENDER_XSCROLL_STEP, RENDER_DECIMATE)
+    return scrub_figures.get(profile).render_snapshot(snapshot, profile)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    sessions.get(DEFAULT_SESSION)
+    yield
+    sessions.close_all()
+    if scrub_figures is not None:
+        scrub_figures.close()
+    if render_pool is not None:
+        render_pool.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware, histogram=REQUEST_SECONDS)
+
+# Per-session routes, mounted both at the root (default session) and under
+# /sessions/{session_id}.
+router = APIRouter()
 
 BASE_DIR = pathlib.Path(__file__).parent
 templates = Jinja2Templates(directory="templates")
@@ -61,11 +419,87 @@ class Stuff(BaseModel):
 
 contact = Contact(first_name="Joe", last_name="Blow", email="joe@blow.com")
 
+DMPLOT_LIST = TypeAdapter(List[DMPlot])
+
+
+def validation_error(e: ValidationError) -> RequestValidationError:
+    # Leave out the rejected input: it may be inf or nan, which JSON can't
+    # carry back.
+    return RequestValidationError(e.errors(include_input=False))
+
+
+async def read_dmplot(request: Request) -> DMPlot:
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith(wire.MEDIA_TYPE):
+        try:
+            with VALIDATION_SECONDS.labels("wire").time():
+                return wire.decode(body)
+        except ValidationError as e:
+            raise validation_error(e)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+    try:
+        with VALIDATION_SECONDS.labels("json").time():
+            return DMPlot.model_validate_json(body)
+    except ValidationError as e:
+        raise validation_error(e)
+
+
+async def read_dmplot_batch(request: Request) -> List[DMPlot]:
+    body = await request.body()
+    try:
+        with VALIDATION_SECONDS.labels("batch").time():
+            return DMPLOT_LIST.validate_json(body)
+    except ValidationError as e:
+        raise validation_error(e)
+
+
+def accepts_wire(request: Request) -> bool:
+    return wire.MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def get_profile(profile: str = None) -> str:
+    if profile is not None and profile not in PROFILES:
+        raise HTTPException(
+            status_code=422,
+            detail=f"profile must be one of {', '.join(PROFILES)}",
+        )
+    return profile
+
+
+def frame_or_503(frame):
+    if frame is None:
+        raise HTTPException(
+            status_code=503,
+            detail="no frame rendered yet",
+            headers={"Retry-After": "1"},
+        )
+    return frame
+
+
+def get_panel(panel: str) -> str:
+    if panel not in PANELS:
+        raise HTTPException(status_code=404, detail="no such panel")
+    return panel
 
-@app.get("/", response_class=HTMLResponse)
-async def index(request: Request):
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag in tags
+
+
+@router.get("/", response_class=HTMLResponse)
+async def index(request: Request, session: Session = Depends(get_session)):
     context = {
         "request": request,
+        "base": session.prefix,
     }
 
     response = templates.TemplateResponse("index.html", context)
@@ -121,66 +555,410 @@ async def put_contact(
     return templates.TemplateResponse("fragments/a.html", context)
 
 
-@app.get("/dmvisdebug", response_class=HTMLResponse)
-async def get_dmvisdebug(request: Request):
-    lead_dist = dmvis.dmplot_state.tram_state_transition.lead_distance
-    safe_emergency_dist = (
-        dmvis.dmplot_state.tram_state_transition.safe_emergency_distance
-    )
-    rail_obs = dmvis.dmplot_state.hlc_state.list_detected_railway_obstacle
-    rail_obs_amount = len(rail_obs)
-    detected_obs = dmvis.dmplot_state.hlc_state.list_detected_obstacle
-    detected_obs_amount = len(detected_obs)
-    tram = dmvis.dmplot_state.tram_state
-    fsm_state = dmvis.dmplot_state.tram_state_transition.fsm_state.name
-    dtc = dmvis.dmplot_state.tram_state_transition.dtc
-    ttc = dmvis.dmplot_state.tram_state_transition.ttc
-    speed_setpoint = dmvis.dmplot_state.hlc_state.speed_setpoint
+def render_debug_fragment(session: Session) -> RenderedFragment:
+    version = session.dmvis.version
+    s = session.dmvis.dmplot_state
+    rail_obs = s.hlc_state.list_detected_railway_obstacle
+    detected_obs = s.hlc_state.list_detected_obstacle
 
     context = {
-        "request": request,
-        "lead_dist": lead_dist,
-        "safe_emergency_dist": safe_emergency_dist,
-        "rail_obs_amount": rail_obs_amount,
+        "base": session.prefix,
+        "lead_dist": s.tram_state_transition.lead_distance,
+        "safe_emergency_dist": s.tram_state_transition.safe_emergency_distance,
+        "rail_obs_amount": len(rail_obs),
         "rail_obs": rail_obs,
-        "detected_obs_amount": detected_obs_amount,
+        "detected_obs_amount": len(detected_obs),
         "detected_obs": detected_obs,
-        "tram": tram,
-        "fsm_state": fsm_state,
-        "dtc": dtc,
-        "ttc": ttc,
-        "speed_setpoint": speed_setpoint,
+        "tram": s.tram_state,
+        "fsm_state": s.tram_state_transition.fsm_state.name,
+        "dtc": s.tram_state_transition.dtc,
+        "ttc": s.tram_state_transition.ttc,
+        "speed_setpoint": s.hlc_state.speed_setpoint,
     }
+    body = templates.get_template("fragments/dmvisdebug.html").render(context)
+    etag = f'"{session.id}-{session.epoch}-debug-{version}"'
+    return RenderedFragment(etag, version, body.encode())
 
-    return templates.TemplateResponse("fragments/dmvisdebug.html", context)
 
-@app.get("/dmvis_data", status_code=200)
-def get_dmvis_data() -> DMPlot:
-    return dmvis.dmplot_state
+@router.get("/dmvisdebug", response_class=HTMLResponse)
+async def get_dmvisdebug(request: Request, session: Session = Depends(get_session)):
+    # Rendered once per state version however many viewers poll; a poll
+    # that already has the current version gets an empty 304.
+    fragment = session.debug_fragment
+    if fragment is None or fragment.version != session.dmvis.version:
+        fragment = render_debug_fragment(session)
+        session.debug_fragment = fragment
 
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    body = fragment.body
+    etag = fragment.etag
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = fragment.gzip
+        # A different representation needs a different strong ETag.
+        etag = etag[:-1] + '-gzip"'
+        headers["Content-Encoding"] = "gzip"
+    headers["ETag"] = etag
 
-@app.get("/dmvis", response_class=HTMLResponse)
-def get_dmvis(request: Request):
-    tic = time.perf_counter_ns()
-    data = dmvis.draw_b64()
-    toc = time.perf_counter_ns()
-    print((toc - tic) / 1_000_000)
+    if etag_matches(request, etag):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="text/html", headers=headers)
+
+
+@router.get("/dmvis_data", status_code=200)
+async def get_dmvis_data(
+    request: Request,
+    since: int = None,
+    timeout: float = LONGPOLL_TIMEOUT_S,
+    session: Session = Depends(get_session),
+) -> DMPlot:
+    # With `since`, hold the request until a state newer than that version
+    # is ingested, or answer 304 after `timeout` seconds.
+    if since is not None:
+        timeout = min(max(timeout, 0.0), LONGPOLL_TIMEOUT_S)
+        if not await session.hub.wait_newer(since, timeout):
+            return Response(
+                status_code=304, headers={"X-DMVis-Version": str(since)}
+            )
+
+    headers = {"X-DMVis-Version": str(session.hub.version)}
+    if accepts_wire(request):
+        try:
+            content = wire.encode(session.dmvis.dmplot_state)
+        except ValueError:
+            # Not representable on the wire, such as an obstacle id beyond
+            # int32; JSON still carries it.
+            pass
+        else:
+            return Response(
+                content=content, media_type=wire.MEDIA_TYPE, headers=headers
+            )
+
+    return Response(
+        content=session.dmvis.dmplot_state.model_dump_json(),
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+@router.get("/dmvis_delta")
+async def get_dmvis_delta(
+    since: int = None,
+    timeout: float = LONGPOLL_TIMEOUT_S,
+    session: Session = Depends(get_session),
+):
+    # Long-polls like /dmvis_data?since=, but answers with only what changed
+    # since that version, or a keyframe if the server no longer has it.
+    if since is not None:
+        timeout = min(max(timeout, 0.0), LONGPOLL_TIMEOUT_S)
+        if not await session.hub.wait_newer(since, timeout):
+            return Response(
+                status_code=304, headers={"X-DMVis-Version": str(since)}
+            )
+
+    message = session.hub.deltas.message(since)
+    if message is None:
+        message = delta.dumps(
+            {
+                "version": session.hub.version,
+                "key": True,
+                "state": session.dmvis.dmplot_state.model_dump(mode="json"),
+            }
+        )
+    return Response(
+        content=message,
+        media_type="application/json",
+        headers={"X-DMVis-Version": str(session.hub.version)},
+    )
+
+
+@router.get("/dmvis", response_class=HTMLResponse)
+def get_dmvis(
+    request: Request,
+    profile: str = Depends(get_profile),
+    session: Session = Depends(get_session),
+):
+    frame = frame_or_503(session.renderer.wait_frame(FRAME_TIMEOUT_S))
 
     context = {
         "request": request,
-        "data": data,
+        "base": session.prefix,
+        "epoch": session.epoch,
+        "version": frame.version,
+        "profile": profile,
     }
 
     return templates.TemplateResponse("fragments/plot1.html", context)
 
 
-@app.post("/dmvis", status_code=201)
-async def update_dmvis(p: DMPlot):
+# Served in whatever format the profile encodes, despite the name.
+@router.get("/dmvis.png")
+def get_dmvis_png(
+    request: Request,
+    profile: str = Depends(get_profile),
+    session: Session = Depends(get_session),
+):
+    frame = frame_or_503(session.renderer.render(profile, timeout=FRAME_TIMEOUT_S))
+    headers = {
+        "ETag": f'"{session.id}-{session.epoch}-{frame.version}-{frame.profile}"',
+        "Cache-Control": "no-cache",
+    }
+
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=frame.data, media_type=frame.media_type, headers=headers)
+
+
+@router.get("/panels", response_class=HTMLResponse)
+def get_panels_page(
+    request: Request,
+    profile: str = Depends(get_profile),
+    session: Session = Depends(get_session),
+):
+    context = {
+        "request": request,
+        "base": session.prefix,
+        "panels": PANEL_REFRESH_MS,
+        "profile": profile,
+    }
+
+    return templates.TemplateResponse("panels.html", context)
+
+
+# Declared before the fragment route, which would otherwise match "bev.png".
+@router.get("/panels/{panel}.png")
+def get_panel_png(
+    request: Request,
+    panel: str = Depends(get_panel),
+    profile: str = Depends(get_profile),
+    session: Session = Depends(get_session),
+):
+    frame = frame_or_503(session.renderer.render(profile, panel))
+    headers = {
+        "ETag": (
+            f'"{session.id}-{session.epoch}-{panel}-{frame.version}-{frame.profile}"'
+        ),
+        "Cache-Control": "no-cache",
+    }
+
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=frame.data, media_type=frame.media_type, headers=headers)
+
+
+@router.get("/panels/{panel}", response_class=HTMLResponse)
+def get_panel_fragment(
+    request: Request,
+    every: int = None,
+    panel: str = Depends(get_panel),
+    profile: str = Depends(get_profile),
+    session: Session = Depends(get_session),
+):
+    # The image URL only changes when the panel does, so the browser
+    # refetches it no faster than its inputs change.
+    context = {
+        "request": request,
+        "base": session.prefix,
+        "panel": panel,
+        "epoch": session.epoch,
+        "version": session.dmvis.panel_versions[panel],
+        "every": every or PANEL_REFRESH_MS[panel],
+        "profile": profile,
+    }
+
+    return templates.TemplateResponse("fragments/panel.html", context)
+
+
+@router.post("/dmvis", status_code=201)
+async def update_dmvis(
+    p: DMPlot = Depends(read_dmplot), session: Session = Depends(create_session)
+):
     # print(p)
-    dmvis.update_dmplot_state(p)
+    session.ingest(p)
     return
 
 
+@router.post("/dmvis/batch", status_code=201)
+async def update_dmvis_batch(
+    ps: List[DMPlot] = Depends(read_dmplot_batch),
+    session: Session = Depends(create_session),
+):
+    session.ingest_many(ps)
+    return {"accepted": len(ps)}
+
+
+def line_too_long(line: int):
+    return HTTPException(
+        status_code=413,
+        detail={
+            "line": line,
+            "error": f"line longer than {STREAM_MAX_LINE_BYTES} bytes",
+        },
+    )
+
+
+@router.post("/dmvis/stream", status_code=201)
+async def update_dmvis_stream(
+    request: Request, session: Session = Depends(create_session)
+):
+    # NDJSON: one DMPlot per line, applied as each chunk arrives.
+    accepted = 0
+    pending = b""
+    async for chunk in request.stream():
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        ps = []
+        for line in lines:
+            if len(line) > STREAM_MAX_LINE_BYTES:
+                session.ingest_many(ps)
+                raise line_too_long(accepted + len(ps))
+            if not line.strip():
+                continue
+            try:
+                with VALIDATION_SECONDS.labels("ndjson").time():
+                    ps.append(DMPlot.model_validate_json(line))
+            except ValidationError as e:
+                session.ingest_many(ps)
+                raise HTTPException(
+                    status_code=422,
+                    detail={"line": accepted + len(ps), "error": str(e)},
+                )
+        session.ingest_many(ps)
+        accepted += len(ps)
+        if len(pending) > STREAM_MAX_LINE_BYTES:
+            raise line_too_long(accepted)
+
+    if pending.strip():
+        try:
+            session.ingest(DMPlot.model_validate_json(pending))
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=422, detail={"line": accepted, "error": str(e)}
+            )
+        accepted += 1
+
+    return {"accepted": accepted}
+
+
+@router.get("/live", response_class=HTMLResponse)
+async def get_live(request: Request, session: Session = Depends(get_session)):
+    context = {
+        "request": request,
+        "base": session.prefix,
+    }
+
+    return templates.TemplateResponse("live.html", context)
+
+
+@router.websocket("/ws/dmvis")
+async def ws_dmvis(websocket: WebSocket, session: Session = Depends(get_session)):
+    await websocket.accept()
+    queue = session.hub.subscribe()
+    try:
+        while True:
+            await websocket.send_text(await queue.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.hub.unsubscribe(queue)
+
+
+@router.websocket("/ws/dmvis_delta")
+async def ws_dmvis_delta(websocket: WebSocket, session: Session = Depends(get_session)):
+    # Each message is a delta from the last version this client was sent, so
+    # a slow client skips straight to the newest state.
+    await websocket.accept()
+    hub = session.hub
+    version = None
+    try:
+        while True:
+            if version is not None and not await hub.wait_newer(
+                version, LONGPOLL_TIMEOUT_S
+            ):
+                continue
+            message = hub.deltas.message(version)
+            if message is None:
+                await hub.wait_newer(hub.version, LONGPOLL_TIMEOUT_S)
+                continue
+            version = hub.deltas.version
+            await websocket.send_text(message)
+    except WebSocketDisconnect:
+        pass
+
+
+@app.get("/recordings")
+def get_recordings():
+    recordings = []
+    if RECORD_DIR and os.path.isdir(RECORD_DIR):
+        for name in sorted(os.listdir(RECORD_DIR)):
+            if not name.endswith(".dmrec"):
+                continue
+            try:
+                recording = Recording(os.path.join(RECORD_DIR, name))
+            except ValueError:
+                continue
+            index = recording.index
+            recordings.append(
+                {
+                    "name": name,
+                    "frames": len(recording),
+                    "t_first": float(index["t_first"][0]) if len(index) else None,
+                    "t_last": float(index["t_last"][-1]) if len(index) else None,
+                }
+            )
+    return recordings
+
+
+@app.get("/recordings/{name}/frame.png")
+def get_recording_frame_png(
+    name: str, t: float, profile: str = Depends(get_profile)
+):
+    recording = open_recording(name)
+    snapshot = snapshot_at(recording, t, XMAX)
+    media_type = PROFILES[profile or DEFAULT_PROFILE].media_type
+    return Response(content=render_scrub(snapshot, profile), media_type=media_type)
+
+
+@router.get("/replay")
+async def get_replay(session: Session = Depends(get_session)):
+    replay = session.replay
+    if replay is None:
+        return {"running": False}
+    return {
+        "running": replay.running,
+        "recording": os.path.basename(replay.recording.path),
+        "speed": replay.speed,
+        "position": replay.position,
+        "frames": len(replay.recording),
+    }
+
+
+@router.post("/replay", status_code=202)
+async def start_replay(
+    recording: str,
+    t: float = None,
+    speed: float = 1.0,
+    session: Session = Depends(create_session),
+):
+    if speed <= 0:
+        raise HTTPException(status_code=422, detail="speed must be positive")
+    if session.replay is not None:
+        session.replay.stop()
+    session.replay = Replay(open_recording(recording), session, start=t, speed=speed)
+    session.replay.start_task()
+    return await get_replay(session)
+
+
+@router.delete("/replay", status_code=204)
+async def stop_replay(session: Session = Depends(get_session)):
+    if session.replay is not None:
+        session.replay.stop()
+        session.replay = None
+
+
 @app.get("/dmvisbak", response_class=HTMLResponse)
 async def get_dmvisbak(request: Request):
     tic = time.perf_counter_ns()
@@ -208,29 +986,61 @@ async def update_dmvisbak(stuff: Stuff):
     return
 
 
-@app.get("/moredebuginfo", status_code=200)
-async def get_moredebuginfo(request: Request):
-    proctime = mdi.proctime.duration
+@router.get("/moredebuginfo", status_code=200)
+async def get_moredebuginfo(request: Request, session: Session = Depends(get_session)):
+    proctime = session.mdi.proctime.duration
 
     context = {
         "request": request,
+        "base": session.prefix,
         "function_duration": proctime,
+        "summary": session.mdi.summary(),
     }
 
     return templates.TemplateResponse("fragments/mdi1.html", context)
 
 
+@router.get("/moredebuginfo/stats", status_code=200)
+async def get_moredebuginfo_stats(session: Session = Depends(get_session)):
+    return session.mdi.summary()
 
-@app.post("/moredebuginfo", status_code=201)
-async def post_moredebuginfo(pt: ProcessingTime):
-    mdi.proctime = pt
+
+@router.post("/moredebuginfo", status_code=201)
+async def post_moredebuginfo(
+    pt: ProcessingTime, session: Session = Depends(create_session)
+):
+    session.mdi.update(pt)
     return
 
-@app.get("/tram/status/speed", status_code=200)
-async def get_can_tram_speed():
-    return tramcan.speed
+@router.get("/tram/status/speed", status_code=200)
+async def get_can_tram_speed(session: Session = Depends(get_session)):
+    return session.tramcan.speed
+
+@router.post("/tram/status/speed", status_code=201)
+async def post_can_tram_speed(
+    status: CANTramStatus, session: Session = Depends(create_session)
+):
+    session.tramcan.speed = status.speed
+
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(content=REGISTRY.exposition(), media_type=CONTENT_TYPE)
+
+
+@app.get("/sessions", status_code=200)
+async def get_sessions():
+    return {
+        "sessions": sessions.ids(),
+        "memory_bytes": sessions.memory_bytes(),
+    }
+
+
+@app.delete("/sessions/{session_id}", status_code=204)
+async def delete_session(session_id: str):
+    if session_id != DEFAULT_SESSION:
+        sessions.remove(session_id)
+
 
-@app.post("/tram/status/speed", status_code=201)
-async def post_can_tram_speed(status: CANTramStatus):
-    tramcan.speed = status.speed
-    print(tramcan.speed)
+app.include_router(router)
+app.include_router(router, prefix="/sessions/{session_id}")
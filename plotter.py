@@ -1,4 +1,5 @@
 from dmvis import *
+from client import DMPlotClient
 import matplotlib
 import matplotlib.animation as animation
 from matplotlib import pyplot as plt
@@ -123,12 +124,29 @@ ax03.legend(
 )
 
 
-def mpl_func_animation_cb(frame):
-    r = requests.get("http://127.0.0.1:8000/dmvis_data")
+artists = (
+    p011,
+    p012,
+    p021,
+    p022,
+    p031,
+    p032,
+    p041,
+    p051,
+    p052,
+    p053,
+    p054,
+)
 
-    j = r.json()
+client = DMPlotClient()
+client.start()
 
-    dmplot_state = DMPlot.model_validate(j)
+
+def mpl_func_animation_cb(frame):
+    dmplot_state = client.take()
+    if dmplot_state is None:
+        # Nothing new since the last frame.
+        return artists
 
     xt = [0.0]
     yt = [0.0]
@@ -153,12 +171,12 @@ def mpl_func_animation_cb(frame):
     x = dmplot_state.tram_state.t
     t.append(x)
 
-    yo = [o.y for o in dmplot_state.hlc_state.list_detected_object]
-    xo = [o.x for o in dmplot_state.hlc_state.list_detected_object]
-    yyre = [o.y for o in dmplot_state.hlc_state.list_rail_horizon]
-    yxre = [o.x for o in dmplot_state.hlc_state.list_rail_horizon]
-    yytp = [o.y for o in dmplot_state.hlc_state.list_trajectory_prediction]
-    yxtp = [o.x for o in dmplot_state.hlc_state.list_trajectory_prediction]
+    yo = dmplot_state.hlc_state.list_detected_object[:, 1]
+    xo = dmplot_state.hlc_state.list_detected_object[:, 0]
+    yyre = dmplot_state.hlc_state.list_rail_horizon[:, 1]
+    yxre = dmplot_state.hlc_state.list_rail_horizon[:, 0]
+    yytp = dmplot_state.hlc_state.list_trajectory_prediction[:, 1]
+    yxtp = dmplot_state.hlc_state.list_trajectory_prediction[:, 0]
 
     p011.set_data(t, yttc)
     p011.set_data(t, ydtc)
@@ -179,19 +197,7 @@ def mpl_func_animation_cb(frame):
         p032.axes.set_xlim(x - xmax + 1.0, x + 1.0)
         p041.axes.set_xlim(x - xmax + 1.0, x + 1.0)
 
-    return (
-        p011,
-        p012,
-        p021,
-        p022,
-        p031,
-        p032,
-        p041,
-        p051,
-        p052,
-        p053,
-        p054,
-    )
+    return artists
 
 
 simulation = animation.FuncAnimation(
@@ -199,3 +205,5 @@ simulation = animation.FuncAnimation(
 )
 
 plt.show()
+client.stop()
+print(client.stats())
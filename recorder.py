@@ -0,0 +1,375 @@
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+from dmvis import OBSTACLE_DTYPE, DMPlot
+
+log = logging.getLogger(__name__)
+
+# A recording is an append-only file of chunks. Each chunk stores up to
+# `chunk_frames` frames column by column:
+#
+#   CHUNK_HEADER (magic, frame count, payload bytes)
+#   one float64 column per SCALAR_COLUMNS entry
+#   for each point list: int64 offsets (n + 1), float64 points (total, 2)
+#   for each obstacle list: int64 offsets (n + 1), OBSTACLE_DTYPE records
+#
+# Everything is 8-byte aligned, so a reader can take zero-copy views of a
+# memory-mapped file. A sidecar "<path>.idx" holds one INDEX_DTYPE row per
+# chunk for seeking by tram_state.t.
+
+FILE_MAGIC = b"DMREC1\0\0"
+CHUNK_MAGIC = b"CHNK"
+CHUNK_HEADER = struct.Struct("<4sIQ")
+
+SCALAR_COLUMNS = (
+    "t",
+    "x",
+    "y",
+    "v",
+    "current_command",
+    "fsm_state",
+    "safe_emergency_distance",
+    "lead_distance",
+    "ttc",
+    "dtc",
+    "speed",
+    "speed_setpoint",
+    "received_at",
+)
+POINT_COLUMNS = (
+    "list_rail_horizon",
+    "list_detected_object",
+    "list_trajectory_prediction",
+)
+OBSTACLE_COLUMNS = (
+    "list_detected_obstacle",
+    "list_detected_railway_obstacle",
+)
+
+INDEX_DTYPE = np.dtype(
+    [
+        ("t_first", "<f8"),
+        ("t_last", "<f8"),
+        ("offset", "<u8"),
+        ("frames", "<u8"),
+    ]
+)
+
+
+def _scalars(p: DMPlot, received_at: float):
+    ts = p.tram_state
+    tst = p.tram_state_transition
+    return (
+        ts.t,
+        ts.x,
+        ts.y,
+        ts.v,
+        ts.current_command,
+        tst.fsm_state,
+        tst.safe_emergency_distance,
+        tst.lead_distance,
+        tst.ttc,
+        tst.dtc,
+        tst.speed,
+        p.hlc_state.speed_setpoint,
+        received_at,
+    )
+
+
+def _ragged(arrays, dtype):
+    offsets = np.zeros(len(arrays) + 1, dtype="<i8")
+    np.cumsum([len(a) for a in arrays], out=offsets[1:])
+    if arrays:
+        values = np.concatenate(arrays).astype(dtype, copy=False)
+    else:
+        values = np.empty(0, dtype=dtype)
+    return offsets.tobytes() + values.tobytes()
+
+
+def _append(f, data: bytes):
+    # All of data or, on error, none of it: a chunk or index row cut short
+    # would be followed by the next one at the wrong offset. `f` is
+    # unbuffered, so nothing is left pending to be written later.
+    offset = f.tell()
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[f.write(view) :]
+    except OSError:
+        try:
+            f.truncate(offset)
+            f.seek(offset)
+        except OSError:
+            pass
+        raise
+    return offset
+
+
+def encode_chunk(frames) -> bytes:
+    scalars = np.array([s for s, _ in frames], dtype="<f8")
+    parts = [np.ascontiguousarray(scalars.T).tobytes()]
+
+    for name in POINT_COLUMNS:
+        points = [getattr(p.hlc_state, name).reshape(-1, 2) for _, p in frames]
+        parts.append(_ragged(points, "<f8"))
+    for name in OBSTACLE_COLUMNS:
+        obstacles = [getattr(p.hlc_state, name) for _, p in frames]
+        parts.append(_ragged(obstacles, OBSTACLE_DTYPE))
+
+    payload = b"".join(parts)
+    return CHUNK_HEADER.pack(CHUNK_MAGIC, len(frames), len(payload)) + payload
+
+
+class FlightRecorder:
+    def __init__(
+        self,
+        path: str,
+        chunk_frames: int = 256,
+        flush_interval: float = 1.0,
+        max_pending: int = 4096,
+    ):
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.flush_interval = flush_interval
+
+        self.recorded = 0
+        self.dropped = 0
+        # Chunks that could not be written; their frames count as dropped.
+        self.failed = 0
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._file = open(path, "ab", buffering=0)
+        self._index = open(path + ".idx", "ab", buffering=0)
+        if self._file.tell() == 0:
+            _append(self._file, FILE_MAGIC)
+
+        self._thread = threading.Thread(
+            target=self._run, name="dmvis-recorder", daemon=True
+        )
+        self._thread.start()
+
+    def record(self, p: DMPlot):
+        # Only enqueue here; column packing and I/O happen on the writer
+        # thread. Frames are dropped rather than blocking ingest.
+        try:
+            self._queue.put_nowait((_scalars(p, time.time()), p))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        # The writer may have died; a full queue must not hang the caller.
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self._thread.join()
+        self._file.close()
+        self._index.close()
+
+    def _write_chunk(self, frames):
+        # A failed write (disk full, EIO) loses this chunk only; the writer
+        # keeps going in case later ones succeed.
+        try:
+            offset = _append(self._file, encode_chunk(frames))
+            entry = np.array(
+                [(frames[0][0][0], frames[-1][0][0], offset, len(frames))],
+                dtype=INDEX_DTYPE,
+            )
+            _append(self._index, entry.tobytes())
+        except Exception:
+            self.failed += 1
+            self.dropped += len(frames)
+            log.exception("%s: writing %d frames failed", self.path, len(frames))
+            return
+        self.recorded += len(frames)
+
+    def _run(self):
+        frames = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = False
+
+            if item is None:
+                if frames:
+                    self._write_chunk(frames)
+                return
+            if item:
+                frames.append(item)
+
+            now = time.monotonic()
+            if len(frames) >= self.chunk_frames or now >= deadline:
+                if frames:
+                    self._write_chunk(frames)
+                    frames = []
+                deadline = now + self.flush_interval
+
+
+class Chunk:
+    def __init__(self, data: np.ndarray, offset: int):
+        magic, frames, size = CHUNK_HEADER.unpack_from(data, offset)
+        if magic != CHUNK_MAGIC:
+            raise ValueError(f"no chunk at offset {offset}")
+        self.frames = frames
+        self.size = CHUNK_HEADER.size + size
+
+        pos = offset + CHUNK_HEADER.size
+        self.scalars = {}
+        for name in SCALAR_COLUMNS:
+            self.scalars[name] = np.frombuffer(data, "<f8", frames, pos)
+            pos += frames * 8
+
+        self.points = {}
+        for name in POINT_COLUMNS:
+            offsets = np.frombuffer(data, "<i8", frames + 1, pos)
+            pos += offsets.nbytes
+            values = np.frombuffer(data, "<f8", 2 * int(offsets[-1]), pos)
+            pos += values.nbytes
+            self.points[name] = (offsets, values.reshape(-1, 2))
+
+        self.obstacles = {}
+        for name in OBSTACLE_COLUMNS:
+            offsets = np.frombuffer(data, "<i8", frames + 1, pos)
+            pos += offsets.nbytes
+            values = np.frombuffer(data, OBSTACLE_DTYPE, int(offsets[-1]), pos)
+            pos += values.nbytes
+            self.obstacles[name] = (offsets, values)
+
+    @property
+    def t(self):
+        return self.scalars["t"]
+
+    def frame(self, i: int) -> DMPlot:
+        s = {name: column[i] for name, column in self.scalars.items()}
+        hlc = {"speed_setpoint": s["speed_setpoint"]}
+        for name, (offsets, values) in self.points.items():
+            hlc[name] = values[offsets[i] : offsets[i + 1]]
+        for name, (offsets, values) in self.obstacles.items():
+            hlc[name] = values[offsets[i] : offsets[i + 1]]
+
+        return DMPlot.model_validate(
+            {
+                "tram_state": {
+                    "current_command": int(s["current_command"]),
+                    "x": s["x"],
+                    "y": s["y"],
+                    "v": s["v"],
+                    "t": s["t"],
+                },
+                "tram_state_transition": {
+                    "fsm_state": int(s["fsm_state"]),
+                    "safe_emergency_distance": s["safe_emergency_distance"],
+                    "lead_distance": s["lead_distance"],
+                    "ttc": s["ttc"],
+                    "dtc": s["dtc"],
+                    "speed": s["speed"],
+                },
+                "hlc_state": hlc,
+            }
+        )
+
+
+class Recording:
+    def __init__(self, path: str):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(self.data[: len(FILE_MAGIC)]) != FILE_MAGIC:
+            raise ValueError(f"{path} is not a DMVis recording")
+
+        self.index = self._load_index()
+        self.starts = np.zeros(len(self.index) + 1, dtype=np.int64)
+        np.cumsum(self.index["frames"], out=self.starts[1:])
+        self._chunks = {}
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def _load_index(self):
+        index_path = self.path + ".idx"
+        if not os.path.exists(index_path):
+            return self._scan_index()
+
+        # Drop index rows whose chunk was cut short, e.g. by a crash.
+        index = np.fromfile(index_path, dtype=INDEX_DTYPE)
+        complete = 0
+        for row in index:
+            offset = int(row["offset"])
+            if offset + CHUNK_HEADER.size > len(self.data):
+                break
+            _, _, size = CHUNK_HEADER.unpack_from(self.data, offset)
+            if offset + CHUNK_HEADER.size + size > len(self.data):
+                break
+            complete += 1
+        return index[:complete]
+
+    def _scan_index(self):
+        rows = []
+        offset = len(FILE_MAGIC)
+        while offset + CHUNK_HEADER.size <= len(self.data):
+            chunk = Chunk(self.data, offset)
+            if offset + chunk.size > len(self.data):
+                break
+            rows.append((chunk.t[0], chunk.t[-1], offset, chunk.frames))
+            offset += chunk.size
+        return np.array(rows, dtype=INDEX_DTYPE)
+
+    def chunk(self, i: int) -> Chunk:
+        chunk = self._chunks.get(i)
+        if chunk is None:
+            chunk = Chunk(self.data, int(self.index[i]["offset"]))
+            self._chunks[i] = chunk
+        return chunk
+
+    def locate(self, n: int):
+        c = int(np.searchsorted(self.starts, n, side="right")) - 1
+        return c, n - int(self.starts[c])
+
+    def frame(self, n: int) -> DMPlot:
+        if not 0 <= n < len(self):
+            raise IndexError(n)
+        c, i = self.locate(n)
+        return self.chunk(c).frame(i)
+
+    def seek(self, t: float) -> int:
+        # Index of the last frame at or before t (the first frame if t is
+        # earlier than the recording). Assumes t only increases within a
+        # recording.
+        if len(self) == 0:
+            raise IndexError("empty recording")
+        c = int(np.searchsorted(self.index["t_first"], t, side="right")) - 1
+        if c < 0:
+            return 0
+        i = int(np.searchsorted(self.chunk(c).t, t, side="right")) - 1
+        return int(self.starts[c]) + max(i, 0)
+
+    def column(self, name: str, start: int, stop: int) -> np.ndarray:
+        # Scalar column for frames [start, stop), read straight from the
+        # chunks it spans.
+        if start >= stop:
+            return np.empty(0)
+        first, _ = self.locate(start)
+        last, _ = self.locate(stop - 1)
+        parts = [self.chunk(c).scalars[name] for c in range(first, last + 1)]
+        begin = start - int(self.starts[first])
+        return np.concatenate(parts)[begin : begin + stop - start]
+
+    def frames(self, start: int = 0, stop: int = None):
+        if stop is None or stop > len(self):
+            stop = len(self)
+        n = start
+        while n < stop:
+            c, i = self.locate(n)
+            chunk = self.chunk(c)
+            for i in range(i, min(chunk.frames, i + stop - n)):
+                yield chunk.frame(i)
+                n += 1
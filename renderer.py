@@ -0,0 +1,320 @@
+import base64
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from encoders import DEFAULT_PROFILE, PROFILES
+from metrics import RENDER_SECONDS
+
+log = logging.getLogger(__name__)
+
+
+class Frame:
+    def __init__(self, version: int, data: bytes, render_ms: float, profile: str):
+        self.version = version
+        self.data = data
+        self.render_ms = render_ms
+        self.profile = profile
+        self.media_type = PROFILES[profile].media_type
+        self._b64 = None
+
+    @property
+    def b64(self):
+        if self._b64 is None:
+            self._b64 = base64.b64encode(self.data).decode("ascii")
+        return self._b64
+
+
+def figure_key(profile: str):
+    p = PROFILES[profile or DEFAULT_PROFILE]
+    return (p.dpi, p.vector)
+
+
+class Figures:
+    # One figure for each DPI the requested profiles need. Changing the DPI
+    # of a shared figure resizes its canvas and throws away its blit
+    # backgrounds, so alternating profiles would redraw everything each
+    # time. SVG gets its own figure too, since savefig redraws it in full.
+    def __init__(self, blit: bool, xscroll_step: float, decimate: str, primary=None):
+        self.options = dict(
+            history_samples=1, blit=blit, xscroll_step=xscroll_step, decimate=decimate
+        )
+        # (profile, DMVisualisation) owned by someone else, used for its key.
+        self.primary = primary
+        self._figures = {}
+        if primary is not None:
+            self._figures[figure_key(primary[0])] = primary[1]
+
+    def get(self, profile: str):
+        from dmvis import DMVisualisation
+
+        key = figure_key(profile)
+        dmvis = self._figures.get(key)
+        if dmvis is None:
+            dmvis = DMVisualisation(**self.options)
+            self._figures[key] = dmvis
+        return dmvis
+
+    def _owned(self):
+        primary = self.primary[1] if self.primary is not None else None
+        return [d for d in self._figures.values() if d is not primary]
+
+    def memory_bytes(self):
+        return sum(d.memory_bytes() for d in self._owned())
+
+    def close(self):
+        for dmvis in self._owned():
+            dmvis.close()
+        self._figures = {}
+
+
+class RenderWorker:
+    def __init__(
+        self,
+        dmvis,
+        fps: float = 30.0,
+        pool=None,
+        name: str = "",
+        profile: str = DEFAULT_PROFILE,
+        idle_s: float = None,
+    ):
+        self.dmvis = dmvis
+        self.period = 1.0 / fps
+        # The loop pauses once nobody has asked for a frame for this long,
+        # and picks up again on the next request. None keeps it running.
+        self.idle_s = idle_s
+        self.pool = pool
+        self.name = name
+        self.profile = profile
+        self.figures = Figures(
+            dmvis.blit, dmvis.xscroll_step, dmvis.decimate, primary=(profile, dmvis)
+        )
+
+        # Every frame rendered, by the loop or on request; the same count as
+        # the render time histogram.
+        self.rendered = 0
+        # Ingested versions superseded before they were drawn.
+        self.skipped = 0
+        # Renders that raised. The loop logs them and carries on.
+        self.failed = 0
+        self._failed_version = None
+
+        # Frames are rendered into the back slot and published by flipping
+        # `_front`, so readers never see a half-written frame.
+        self._frames = [None, None]
+        self._front = 0
+        # Latest frame for each other (panel, profile), rendered only when
+        # asked for.
+        self._extra = {}
+        self._extra_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        # Set while the loop runs; cleared while it is paused for no viewers.
+        self._wake = threading.Event()
+        self._wake.set()
+        self._viewed = None
+        self._thread = None
+
+    @property
+    def frame(self):
+        return self._frames[self._front]
+
+    def memory_bytes(self):
+        frames = self._frames + list(self._extra.values())
+        frame_bytes = sum(len(f.data) for f in frames if f is not None)
+        return frame_bytes + self.figures.memory_bytes()
+
+    @property
+    def paused(self):
+        return not self._wake.is_set()
+
+    def watch(self):
+        # Marks the frames as wanted, resuming a paused loop.
+        self._viewed = time.monotonic()
+        if self.paused:
+            frame = self.frame
+            version = self.dmvis.version
+            stale = frame is not None and frame.version != version
+            if stale and version != self._failed_version:
+                # Hold viewers until the loop has caught up.
+                self._ready.clear()
+            self._wake.set()
+
+    def _idle(self):
+        if self.idle_s is None:
+            return False
+        return self._viewed is None or time.monotonic() - self._viewed > self.idle_s
+
+    def wait_frame(self, timeout: float = None):
+        # None if no frame has been rendered within `timeout`.
+        self.watch()
+        self._ready.wait(timeout)
+        return self.frame
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="dmvis-render", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        with self._extra_lock:
+            self.figures.close()
+        RENDER_SECONDS.remove(self.name)
+
+    def _render(self, profile: str, panel: str = None) -> Frame:
+        tic = time.perf_counter_ns()
+        dmvis = None if self.pool is not None else self.figures.get(profile)
+        if dmvis is self.dmvis:
+            version, data = self.dmvis.render(profile, panel)
+        else:
+            snapshot = self.dmvis.snapshot(copy=True)
+            version = snapshot.version
+            if dmvis is None:
+                data = self.pool.render(snapshot, profile, panel)
+            else:
+                data = dmvis.render_snapshot(snapshot, profile, panel)
+        toc = time.perf_counter_ns()
+        render_ms = (toc - tic) / 1_000_000
+        RENDER_SECONDS.labels(self.name).observe(render_ms / 1000)
+        self.rendered += 1
+        return Frame(version, data, render_ms, profile)
+
+    def render_once(self, resumed: bool = False):
+        frame = self._render(self.profile)
+
+        previous = self.frame
+        # Versions ingested while paused were never due to be drawn.
+        gap = 0 if previous is None else frame.version - previous.version - 1
+        if gap > 0 and not resumed:
+            self.skipped += gap
+
+        back = 1 - self._front
+        self._frames[back] = frame
+        self._front = back
+        self._ready.set()
+
+    def render(self, profile: str = None, panel: str = None, timeout: float = None):
+        # The whole figure in the live profile comes from the render loop.
+        # Anything else is rendered on request and kept until its inputs
+        # change, so viewers share it; a panel is versioned by the last state
+        # that changed it.
+        profile = profile or self.profile
+        if panel is None and profile == self.profile:
+            return self.wait_frame(timeout)
+        self.watch()
+        with self._extra_lock:
+            if panel is None:
+                version = self.dmvis.version
+            else:
+                version = self.dmvis.panel_versions[panel]
+            frame = self._extra.get((panel, profile))
+            if frame is None or frame.version < version:
+                try:
+                    frame = self._render(profile, panel)
+                except Exception:
+                    self.failed += 1
+                    log.exception(
+                        "%s: rendering %s/%s failed", self.name, panel, profile
+                    )
+                    return frame
+                if panel is not None:
+                    frame.version = version
+                self._extra[(panel, profile)] = frame
+            return frame
+
+    def _run(self):
+        resumed = False
+        while not self._stop.is_set():
+            if self._idle():
+                self._wake.clear()
+                # Checked again so a watch() between the two is not lost.
+                if self._idle():
+                    self._wake.wait()
+                    resumed = True
+                continue
+            tic = time.perf_counter()
+            frame = self.frame
+            version = self.dmvis.version
+            stale = frame is None or frame.version != version
+            # A version that failed is not retried; the next one may render.
+            if stale and version != self._failed_version:
+                try:
+                    self.render_once(resumed)
+                    self._failed_version = None
+                except Exception:
+                    self.failed += 1
+                    self._failed_version = version
+                    log.exception(
+                        "%s: rendering version %d failed", self.name, version
+                    )
+                    # watch() may have held viewers for this render; they get
+                    # the last frame instead of waiting out their timeout.
+                    self._ready.set()
+            resumed = False
+            elapsed = time.perf_counter() - tic
+            self._stop.wait(max(0.0, self.period - elapsed))
+
+
+_worker_figures = None
+
+
+def _init_render_process(blit: bool, xscroll_step: float, decimate: str):
+    global _worker_figures
+
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+    _worker_figures = Figures(blit, xscroll_step, decimate)
+
+
+def _render_in_process(snapshot, profile: str, panel: str) -> bytes:
+    return _worker_figures.get(profile).render_snapshot(snapshot, profile, panel)
+
+
+class RenderPool:
+    def __init__(
+        self, processes: int, blit: bool, xscroll_step: float, decimate: str
+    ):
+        self.processes = processes
+        self.initargs = (blit, xscroll_step, decimate)
+        self._lock = threading.Lock()
+        self.executor = self._new_executor()
+
+    def _new_executor(self):
+        # Spawned, not forked: the server already runs render threads.
+        return ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_render_process,
+            initargs=self.initargs,
+        )
+
+    def render(self, snapshot, profile: str = None, panel: str = None) -> bytes:
+        executor = self.executor
+        try:
+            future = executor.submit(_render_in_process, snapshot, profile, panel)
+            return future.result()
+        except BrokenProcessPool:
+            # A worker died. Replace the pool so later renders can succeed,
+            # and let this one fail.
+            with self._lock:
+                if self.executor is executor:
+                    self.executor = self._new_executor()
+            raise
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
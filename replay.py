@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import numpy as np
+
+from dmvis import HISTORY_FIELDS, Snapshot
+from recorder import Recording
+
+
+def snapshot_at(recording: Recording, t: float, history_seconds: float, version=0):
+    # The frame at or before t plus the history_seconds of columns leading up
+    # to it, as DMVisualisation.snapshot would have produced them live. The
+    # window ends at the frame's own time, not at t, which may fall between
+    # frames.
+    n = recording.seek(t)
+    t0 = recording.column("t", n, n + 1)[0] - history_seconds
+    start = recording.seek(t0)
+    if recording.column("t", start, start + 1)[0] < t0:
+        start += 1
+    history = np.vstack(
+        [recording.column(name, start, n + 1) for name in HISTORY_FIELDS]
+    )
+    return Snapshot.from_state(version, recording.frame(n), history)
+
+
+class Replay:
+    def __init__(self, recording: Recording, session, start: float = None, speed=1.0):
+        self.recording = recording
+        self.session = session
+        self.speed = speed
+        self.start = 0 if start is None else recording.seek(start)
+        self.position = self.start
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start_task(self):
+        # The session's history must not run backwards in t.
+        self.session.dmvis.history.clear()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        t0 = None
+        wall0 = time.monotonic()
+        for p in self.recording.frames(self.start):
+            t = p.tram_state.t
+            if t0 is None:
+                t0 = t
+            delay = wall0 + (t - t0) / self.speed - time.monotonic()
+            await asyncio.sleep(max(delay, 0.0))
+            # Replayed frames are already on disk.
+            self.session.ingest(p, record=False)
+            self.position += 1
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionStore:
+    def __init__(
+        self,
+        factory,
+        max_bytes: int,
+        idle_timeout: float,
+        pinned=(),
+    ):
+        self.factory = factory
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self.pinned = set(pinned)
+
+        # Ordered from least to most recently used.
+        self._sessions = OrderedDict()
+        self._last_used = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def ids(self):
+        return list(self._sessions)
+
+    def values(self):
+        return list(self._sessions.values())
+
+    def get(self, session_id: str, create: bool = True):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                if not create:
+                    return None
+                session = self.factory(session_id)
+                self._sessions[session_id] = session
+                session.start()
+            self._sessions.move_to_end(session_id)
+            self._last_used[session_id] = time.monotonic()
+            evicted = self._evict(keep=session_id)
+
+        for s in evicted:
+            s.close()
+
+        return session
+
+    def touch(self, session_id: str):
+        # Marks a session as used without a request, e.g. while a stream or
+        # a replay keeps feeding it, so it is not evicted as idle.
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions.move_to_end(session_id)
+                self._last_used[session_id] = time.monotonic()
+
+    def remove(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            self._last_used.pop(session_id, None)
+
+        if session is not None:
+            session.close()
+
+    def close_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            self._last_used.clear()
+
+        for session in sessions:
+            session.close()
+
+    def memory_bytes(self):
+        return sum(s.memory_bytes() for s in self._sessions.values())
+
+    def _evict(self, keep: str):
+        now = time.monotonic()
+        candidates = [
+            sid for sid in self._sessions if sid != keep and sid not in self.pinned
+        ]
+
+        evicted = []
+        total = self.memory_bytes()
+        for sid in candidates:
+            idle = now - self._last_used[sid]
+            if total <= self.max_bytes and idle < self.idle_timeout:
+                continue
+            session = self._sessions.pop(sid)
+            del self._last_used[sid]
+            total -= session.memory_bytes()
+            evicted.append(session)
+
+        return evicted
@@ -0,0 +1,358 @@
+// Client-side rendering of the DMVisualisation panels from /ws/dmvis_delta.
+(function () {
+	"use strict";
+
+	var XMAX = 10.0;
+	var MARGIN = { top: 30, right: 50, bottom: 35, left: 50 };
+
+	var SVG_NS = "http://www.w3.org/2000/svg";
+
+	var history = [];
+	var state = null;
+	var stateVersion = null;
+	var pending = false;
+
+	// Just enough of d3's scales, axes and line paths for these panels, so
+	// the page needs no third-party bundle.
+	function attrs(node, values) {
+		Object.keys(values).forEach(function (name) {
+			if (values[name] === null || values[name] === undefined) {
+				node.removeAttribute(name);
+			} else {
+				node.setAttribute(name, values[name]);
+			}
+		});
+		return node;
+	}
+
+	function append(parent, name, values) {
+		var node = document.createElementNS(SVG_NS, name);
+		parent.appendChild(node);
+		return attrs(node, values || {});
+	}
+
+	function text(parent, values, content) {
+		var node = append(parent, "text", values);
+		node.textContent = content;
+		return node;
+	}
+
+	function clear(node) {
+		while (node.firstChild) {
+			node.removeChild(node.firstChild);
+		}
+	}
+
+	// Keeps exactly n children of the given tag, like a d3 data join.
+	function children(parent, name, n) {
+		while (parent.childNodes.length > n) {
+			parent.removeChild(parent.lastChild);
+		}
+		while (parent.childNodes.length < n) {
+			append(parent, name);
+		}
+		return Array.prototype.slice.call(parent.childNodes);
+	}
+
+	function scaleLinear(domain, range) {
+		function scale(v) {
+			return range[0] + (v - domain[0]) / (domain[1] - domain[0]) * (range[1] - range[0]);
+		}
+		scale.domain = function (d) {
+			domain = d;
+			return scale;
+		};
+		scale.ticks = function (count) {
+			var step = Math.pow(10, Math.floor(Math.log10((domain[1] - domain[0]) / count)));
+			var error = (domain[1] - domain[0]) / count / step;
+			if (error >= Math.sqrt(50)) {
+				step *= 10;
+			} else if (error >= Math.sqrt(10)) {
+				step *= 5;
+			} else if (error >= Math.sqrt(2)) {
+				step *= 2;
+			}
+			var ticks = [];
+			for (var i = Math.ceil(domain[0] / step); i * step <= domain[1] + step * 1e-9; i++) {
+				ticks.push(+(i * step).toFixed(10));
+			}
+			return ticks;
+		};
+		scale.range = range;
+		return scale;
+	}
+
+	// Draws an axis into g, replacing what was there; side is "bottom",
+	// "left" or "right" of the plot area.
+	function axis(g, scale, side) {
+		clear(g);
+		var horizontal = side === "bottom";
+		var sign = side === "left" ? -1 : 1;
+		var r = scale.range;
+		append(g, "path", {
+			d: horizontal ? "M" + r[0] + ",0H" + r[1] : "M0," + r[0] + "V" + r[1],
+			stroke: "currentColor",
+			fill: "none",
+		});
+		scale.ticks(horizontal ? 10 : 8).forEach(function (v) {
+			var p = scale(v);
+			var tick = append(g, "g", {
+				transform: horizontal ? "translate(" + p + ",0)" : "translate(0," + p + ")",
+			});
+			append(tick, "line", horizontal ? { y2: 6, stroke: "currentColor" } : { x2: 6 * sign, stroke: "currentColor" });
+			text(tick, horizontal
+				? { y: 9, dy: "0.71em", "text-anchor": "middle", "font-size": 10 }
+				: { x: 9 * sign, dy: "0.32em", "text-anchor": sign < 0 ? "end" : "start", "font-size": 10 },
+				String(v));
+		});
+	}
+
+	function linePath(points, fx, fy) {
+		return points.map(function (d, i) {
+			return (i === 0 ? "M" : "L") + fx(d) + "," + fy(d);
+		}).join("");
+	}
+
+	// A triangle of the given area, as d3.symbolTriangle draws it.
+	function triangle(area) {
+		var side = Math.sqrt(area * 4 / Math.sqrt(3));
+		var height = side * Math.sqrt(3) / 2;
+		return "M0," + (-height * 2 / 3) + "L" + side / 2 + "," + height / 3 + "L" + (-side / 2) + "," + height / 3 + "Z";
+	}
+
+	function timeSeriesPanel(selector, title, yDomain, series) {
+		var svg = document.querySelector(selector);
+		var width = +svg.getAttribute("width") - MARGIN.left - MARGIN.right;
+		var height = +svg.getAttribute("height") - MARGIN.top - MARGIN.bottom;
+		var x = scaleLinear([0, XMAX], [0, width]);
+		var y = scaleLinear(yDomain, [height, 0]);
+
+		text(svg, { x: +svg.getAttribute("width") / 2, y: 18, "text-anchor": "middle" }, title);
+
+		var g = append(svg, "g", { transform: "translate(" + MARGIN.left + "," + MARGIN.top + ")" });
+		var clip = append(g, "clipPath", { id: selector.slice(1) + "-clip" });
+		append(clip, "rect", { width: width, height: height });
+
+		var xAxis = append(g, "g", { transform: "translate(0," + height + ")" });
+		axis(append(g, "g"), y, "left");
+		axis(append(g, "g", { transform: "translate(" + width + ",0)" }), y, "right");
+
+		var plot = append(g, "g", { "clip-path": "url(#" + selector.slice(1) + "-clip)" });
+		var paths = series.map(function (s) {
+			return append(plot, "path", {
+				fill: "none",
+				stroke: s.color,
+				"stroke-width": 1.5,
+				"stroke-dasharray": s.dash || null,
+			});
+		});
+
+		series.forEach(function (s, i) {
+			var item = append(g, "g", { transform: "translate(" + (width - 110) + "," + (10 + i * 16) + ")" });
+			append(item, "line", { x2: 20, stroke: s.color, "stroke-dasharray": s.dash || null });
+			text(item, { x: 25, dy: "0.35em", "font-size": "11px" }, s.label);
+		});
+
+		return function draw(samples, t) {
+			if (t >= XMAX - 1.0) {
+				x.domain([t - XMAX + 1.0, t + 1.0]);
+			} else {
+				x.domain([0, XMAX]);
+			}
+			axis(xAxis, x, "bottom");
+
+			series.forEach(function (s, i) {
+				paths[i].setAttribute("d", linePath(
+					samples,
+					function (d) { return x(d.t); },
+					function (d) { return y(s.value(d)); }
+				));
+			});
+		};
+	}
+
+	function bevPanel(selector) {
+		var svg = document.querySelector(selector);
+		var width = +svg.getAttribute("width") - MARGIN.left - MARGIN.right;
+		var height = +svg.getAttribute("height") - MARGIN.top - MARGIN.bottom;
+		var x = scaleLinear([-25, 25], [0, width]);
+		var y = scaleLinear([-1, 100], [height, 0]);
+
+		text(svg, { x: +svg.getAttribute("width") / 2, y: 18, "text-anchor": "middle" }, "Bird Eye View");
+
+		var g = append(svg, "g", { transform: "translate(" + MARGIN.left + "," + MARGIN.top + ")" });
+		axis(append(g, "g", { transform: "translate(0," + height + ")" }), x, "bottom");
+		axis(append(g, "g"), y, "left");
+		append(g, "rect", {
+			x: x(-1.2),
+			width: x(1.3) - x(-1.2),
+			height: height,
+			fill: "gray",
+			opacity: 0.5,
+		});
+
+		var railHorizon = append(g, "path", { fill: "none", stroke: "green", "stroke-width": 1.5 });
+		var trajectory = append(g, "g");
+		var obstacles = append(g, "g");
+		var tram = append(g, "g");
+		var marker = triangle(40);
+
+		// Points are drawn with y across and x along the track, as in ax05.
+		function across(d) { return x(d.y); }
+		function along(d) { return y(d.x); }
+
+		return function draw(s) {
+			var hlc = s.hlc_state;
+			railHorizon.setAttribute("d", linePath(hlc.list_rail_horizon, across, along));
+
+			var points = hlc.list_trajectory_prediction;
+			children(trajectory, "circle", points.length).forEach(function (node, i) {
+				attrs(node, { r: 2, fill: "blue", cx: across(points[i]), cy: along(points[i]) });
+			});
+
+			var objects = hlc.list_detected_object;
+			children(obstacles, "path", objects.length).forEach(function (node, i) {
+				attrs(node, {
+					d: marker,
+					fill: "blue",
+					transform: "translate(" + across(objects[i]) + "," + along(objects[i]) + ")",
+				});
+			});
+
+			var corners = [{ x: 0.0, y: 0.0 }, { x: s.tram_state.x, y: s.tram_state.y }];
+			children(tram, "rect", corners.length).forEach(function (node, i) {
+				attrs(node, {
+					width: 7,
+					height: 7,
+					fill: "green",
+					x: x(corners[i].x) - 3.5,
+					y: y(corners[i].y) - 3.5,
+				});
+			});
+		};
+	}
+
+	var drawTTC = timeSeriesPanel("#panel-ttc", "TTC and DTC vs Time", [0, 50], [
+		{ label: "TTC", color: "cyan", value: function (d) { return d.ttc; } },
+		{ label: "DTC", color: "#1f77b4", value: function (d) { return d.dtc; } },
+	]);
+	var drawDistance = timeSeriesPanel("#panel-distance", "Distance vs Time", [0, 70], [
+		{ label: "distance", color: "#bfbf00", value: function (d) { return d.lead_distance; } },
+		{ label: "safe distance", color: "green", value: function (d) { return d.safe_emergency_distance; } },
+	]);
+	var drawVelocity = timeSeriesPanel("#panel-velocity", "Velocity, state, and Command vs Time", [-6, 8], [
+		{ label: "reference speed", color: "blue", value: function (d) { return d.speed_setpoint; } },
+		{ label: "actual speed", color: "red", value: function (d) { return d.v; } },
+		{ label: "dbw command", color: "magenta", dash: "6,2,1,2", value: function (d) { return d.current_command; } },
+		{ label: "state", color: "black", value: function (d) { return d.fsm_state; } },
+	]);
+	var drawBEV = bevPanel("#panel-bev");
+
+	function draw() {
+		pending = false;
+		var t = state.tram_state.t;
+		drawTTC(history, t);
+		drawDistance(history, t);
+		drawVelocity(history, t);
+		drawBEV(state);
+	}
+
+	function accept(s) {
+		var t = s.tram_state.t;
+		if (history.length > 0 && t < history[history.length - 1].t) {
+			// The producer restarted its clock.
+			history = [];
+		}
+		history.push({
+			t: t,
+			ttc: s.tram_state_transition.ttc,
+			dtc: s.tram_state_transition.dtc,
+			lead_distance: s.tram_state_transition.lead_distance,
+			safe_emergency_distance: s.tram_state_transition.safe_emergency_distance,
+			speed_setpoint: s.hlc_state.speed_setpoint,
+			v: s.tram_state.v,
+			current_command: s.tram_state.current_command,
+			fsm_state: s.tram_state_transition.fsm_state,
+		});
+		while (history.length > 0 && history[0].t < t - XMAX) {
+			history.shift();
+		}
+		state = s;
+
+		if (!pending) {
+			pending = true;
+			window.requestAnimationFrame(draw);
+		}
+	}
+
+	// Mirrors delta.apply on the server.
+	function applyDelta(s, delta) {
+		var next = {
+			tram_state: Object.assign({}, s.tram_state, delta.tram_state),
+			tram_state_transition: Object.assign({}, s.tram_state_transition, delta.tram_state_transition),
+			hlc_state: Object.assign({}, s.hlc_state),
+		};
+		var hlc = delta.hlc_state || {};
+		Object.keys(hlc).forEach(function (name) {
+			var d = hlc[name];
+			if (name === "speed_setpoint" || Array.isArray(d)) {
+				next.hlc_state[name] = d;
+			} else if ("set" in d) {
+				var points = s.hlc_state[name].slice(0, d.n);
+				d.set.forEach(function (p) { points[p[0]] = { x: p[1], y: p[2] }; });
+				next.hlc_state[name] = points;
+			} else {
+				var removed = new Set(d.remove);
+				var upsert = new Map(d.upsert.map(function (o) { return [o.id, o]; }));
+				var obstacles = [];
+				s.hlc_state[name].forEach(function (o) {
+					if (removed.has(o.id)) {
+						return;
+					}
+					if (upsert.has(o.id)) {
+						obstacles.push(upsert.get(o.id));
+						upsert.delete(o.id);
+					} else {
+						obstacles.push(o);
+					}
+				});
+				upsert.forEach(function (o) { obstacles.push(o); });
+				next.hlc_state[name] = obstacles;
+			}
+		});
+		return next;
+	}
+
+	function receive(message) {
+		var s;
+		if (message.key) {
+			s = message.state;
+		} else if (state !== null && message.base === stateVersion) {
+			s = applyDelta(state, message.delta);
+		} else {
+			// Out of step; the next keyframe resynchronises us.
+			return;
+		}
+		stateVersion = message.version;
+		accept(s);
+	}
+
+	function connect() {
+		var status = document.getElementById("dmvis-status");
+		var scheme = window.location.protocol === "https:" ? "wss://" : "ws://";
+		var path = document.getElementById("dmvis-live").dataset.ws;
+		var socket = new WebSocket(scheme + window.location.host + path);
+
+		socket.onopen = function () { status.textContent = "live"; };
+		socket.onmessage = function (event) {
+			receive(JSON.parse(event.data));
+		};
+		socket.onclose = function () {
+			stateVersion = null;
+			status.textContent = "reconnecting";
+			window.setTimeout(connect, 1000);
+		};
+	}
+
+	connect();
+})();
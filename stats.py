@@ -0,0 +1,64 @@
+import numpy as np
+
+from history import History
+
+SPARK_BARS = "▁▂▃▄▅▆▇█"
+
+
+class RollingStats:
+    def __init__(self, window: int = 1024, spark_points: int = 40):
+        # Samples live in a History ring, so readers take a view of the
+        # newest samples without locking out the writer.
+        self.samples = History(("t", "value"), window)
+        self.spark_points = spark_points
+        self.count = 0
+
+        self._summary = None
+        self._summary_count = -1
+
+    def add(self, t: float, value: float):
+        self.samples.append((t, value))
+        self.count += 1
+
+    def summary(self):
+        # Recomputed only when new samples have arrived since the last read,
+        # so frequent polling costs nothing between updates.
+        count = self.count
+        if self._summary_count != count:
+            self._summary = self._summarise(count)
+            self._summary_count = count
+        return self._summary
+
+    def _summarise(self, count: int):
+        h = self.samples.tail()
+        t, values = h[0], h[1]
+        if len(values) == 0:
+            return {"count": 0}
+
+        p50, p90, p99 = np.percentile(values, (50, 90, 99))
+        span = t[-1] - t[0]
+        return {
+            "count": count,
+            "window": len(values),
+            "last": float(values[-1]),
+            "min": float(values.min()),
+            "mean": float(values.mean()),
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+            "max": float(values.max()),
+            "rate": (len(values) - 1) / span if span > 0 else 0.0,
+            "sparkline": self.sparkline(values),
+        }
+
+    def sparkline(self, values: np.ndarray) -> str:
+        # The worst value in each slot, so a single slow iteration still
+        # shows up.
+        values = values[-4 * self.spark_points :]
+        n = min(len(values), self.spark_points)
+        slots = np.array([s.max() for s in np.array_split(values, n)])
+        lo, hi = slots.min(), slots.max()
+        if hi == lo:
+            return SPARK_BARS[0] * len(slots)
+        levels = ((slots - lo) / (hi - lo) * (len(SPARK_BARS) - 1)).round().astype(int)
+        return "".join(SPARK_BARS[i] for i in levels)
@@ -0,0 +1,92 @@
+import math
+
+import numpy as np
+
+# Synthetic DMPlot frames in the shape of test3.json: the tram closing on a
+# lead obstacle down a straight rail horizon, with noise from a seeded RNG
+# so runs are reproducible.
+
+
+class DMPlotGenerator:
+    def __init__(
+        self,
+        rail_horizon: int = 31,
+        obstacles: int = 1,
+        railway_obstacles: int = 1,
+        detected_objects: int = 1,
+        trajectory: int = 1,
+        rate: float = 30.0,
+        seed: int = 0,
+    ):
+        self.rail_horizon = rail_horizon
+        self.obstacles = obstacles
+        self.railway_obstacles = railway_obstacles
+        self.detected_objects = detected_objects
+        self.trajectory = trajectory
+        self.dt = 1.0 / rate
+        self.rng = np.random.default_rng(seed)
+
+    def _points(self, n: int, near: float):
+        x = near + self.rng.normal(0.0, 0.5, n)
+        y = self.rng.normal(0.0, 0.1, n)
+        return [{"x": float(a), "y": float(b)} for a, b in zip(x, y)]
+
+    def _obstacles(self, n: int, near: float):
+        return [
+            {
+                "id": i,
+                "x": float(near + 2.0 * i + self.rng.normal(0.0, 0.05)),
+                "y": float(self.rng.normal(0.0, 0.1)),
+                "v": float(abs(self.rng.normal(near, 0.1))),
+                "d": 0.0,
+            }
+            for i in range(n)
+        ]
+
+    def frame(self, i: int) -> dict:
+        t = i * self.dt
+        # Lead distance swings between roughly 5 m and 45 m.
+        lead = 25.0 + 20.0 * math.sin(t / 5.0)
+        v = 4.0 + 3.0 * math.cos(t / 5.0) + float(self.rng.normal(0.0, 0.05))
+        v = max(v, 0.0)
+        ttc = min(lead / v, 1000.0) if v > 0.1 else 1000.0
+        if lead < 10.0:
+            fsm_state = 2
+        elif lead < 20.0:
+            fsm_state = 1
+        else:
+            fsm_state = 0
+
+        return {
+            "tram_state": {
+                "current_command": int(self.rng.integers(-5, 8)),
+                "x": 0.0,
+                "y": 0.0,
+                "v": v,
+                "t": t,
+            },
+            "tram_state_transition": {
+                "fsm_state": fsm_state,
+                "safe_emergency_distance": float(15.0 + self.rng.normal(0.0, 0.2)),
+                "lead_distance": lead,
+                "ttc": ttc,
+                "dtc": max(lead - 1.0, 0.0),
+                "speed": v,
+            },
+            "hlc_state": {
+                "speed_setpoint": 5.0,
+                "list_rail_horizon": [
+                    {"x": float(k), "y": 0.0} for k in range(self.rail_horizon)
+                ],
+                "list_detected_object": self._points(self.detected_objects, lead),
+                "list_trajectory_prediction": self._points(self.trajectory, lead),
+                "list_detected_obstacle": self._obstacles(self.obstacles, lead),
+                "list_detected_railway_obstacle": self._obstacles(
+                    self.railway_obstacles, lead
+                ),
+            },
+        }
+
+    def frames(self, n: int, start: int = 0):
+        for i in range(start, start + n):
+            yield self.frame(i)
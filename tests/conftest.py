@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# The server's modules live at the top of the repository.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dmvis import DMPlot  # noqa: E402
+from synth import DMPlotGenerator  # noqa: E402
+
+
+@pytest.fixture
+def frames():
+    # frames(n) gives n consecutive synthetic DMPlots with a few obstacles
+    # and trajectory points, so every list has something to carry.
+    def make(n=20, **options):
+        options = {"obstacles": 3, "railway_obstacles": 2, "trajectory": 5, **options}
+        generator = DMPlotGenerator(**options)
+        return [DMPlot.model_validate(f) for f in generator.frames(n)]
+
+    return make
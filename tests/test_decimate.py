@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from decimate import REDUCERS, lttb, minmax
+
+
+def series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.arange(n, dtype=float) / 30.0
+    return x, rng.normal(0.0, 1.0, n).cumsum()
+
+
+@pytest.mark.parametrize("reduce", [minmax, lttb])
+def test_short_series_pass_through(reduce):
+    x, y = series(20)
+
+    rx, ry = reduce(x, y, 20)
+
+    assert rx is x and ry is y
+
+
+@pytest.mark.parametrize("reduce", REDUCERS.values())
+@pytest.mark.parametrize("n", [101, 1000, 1037])
+def test_keep_ends_and_order(reduce, n):
+    x, y = series(n)
+
+    rx, ry = reduce(x, y, 40)
+
+    assert rx[0] == x[0] and rx[-1] == x[-1]
+    assert ry[0] == y[0] and ry[-1] == y[-1]
+    assert np.all(np.diff(rx) > 0)
+    # Every point kept is a real sample.
+    np.testing.assert_array_equal(ry, y[np.searchsorted(x, rx)])
+
+
+@pytest.mark.parametrize("n", [1000, 1037])
+def test_minmax_keeps_each_buckets_extremes(n):
+    x, y = series(n)
+    buckets = 40
+
+    rx, ry = minmax(x, y, buckets)
+
+    k = (n - 2) // buckets
+    for b in range(buckets):
+        run = y[1 + b * k : 1 + (b + 1) * k]
+        assert run.min() in ry and run.max() in ry
+    # The samples left over after the last full bucket are kept as they are.
+    end = 1 + buckets * k
+    assert len(rx) == 2 * buckets + 1 + n - end
+
+
+def test_minmax_keeps_spikes():
+    x = np.arange(1000, dtype=float)
+    y = np.zeros(1000)
+    y[333], y[777] = 50.0, -50.0
+
+    _, ry = minmax(x, y, 20)
+
+    assert ry.max() == 50.0 and ry.min() == -50.0
+
+
+def test_lttb_gives_threshold_points_and_keeps_a_spike():
+    x = np.arange(1000, dtype=float)
+    y = np.zeros(1000)
+    y[500] = 50.0
+
+    rx, ry = lttb(x, y, 50)
+
+    assert len(rx) == 50
+    assert 500.0 in rx and ry.max() == 50.0
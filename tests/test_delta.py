@@ -0,0 +1,130 @@
+import json
+
+import pytest
+
+import delta
+from dmvis import DMPlot
+
+
+def state(p: DMPlot) -> dict:
+    return p.model_dump(mode="json")
+
+
+def modified(p: DMPlot, change) -> DMPlot:
+    s = state(p)
+    change(s["hlc_state"])
+    return DMPlot.model_validate(s)
+
+
+def assert_round_trip(old: DMPlot, new: DMPlot):
+    d = delta.diff(old, new)
+    # Deltas go out as JSON.
+    d = json.loads(json.dumps(d))
+    assert delta.apply(state(old), d) == state(new)
+
+
+def test_consecutive_frames(frames):
+    ps = frames(30)
+    for old, new in zip(ps, ps[1:]):
+        assert_round_trip(old, new)
+
+
+def test_unchanged_state_is_empty(frames):
+    p = frames(1)[0]
+
+    assert delta.diff(p, p) == {}
+
+
+def test_few_changed_points_are_patched(frames):
+    old = frames(1, rail_horizon=31)[0]
+
+    def move_one(hlc):
+        hlc["list_rail_horizon"][7]["y"] += 1.0
+
+    new = modified(old, move_one)
+
+    d = delta.diff(old, new)
+    assert d["hlc_state"]["list_rail_horizon"]["n"] == 31
+    assert [i for i, _, _ in d["hlc_state"]["list_rail_horizon"]["set"]] == [7]
+    assert_round_trip(old, new)
+
+
+def test_resized_points_are_replaced(frames):
+    old = frames(1)[0]
+
+    def drop_last(hlc):
+        hlc["list_rail_horizon"].pop()
+
+    new = modified(old, drop_last)
+
+    assert isinstance(delta.diff(old, new)["hlc_state"]["list_rail_horizon"], list)
+    assert_round_trip(old, new)
+
+
+def test_obstacles_added_removed_and_updated(frames):
+    old = frames(1)[0]
+
+    def change(hlc):
+        obstacles = hlc["list_detected_obstacle"]
+        del obstacles[0]
+        obstacles[0]["x"] += 1.0
+        obstacles.append({"id": 99, "x": 1.0, "y": 2.0, "v": 3.0, "d": 4.0})
+
+    new = modified(old, change)
+
+    d = delta.diff(old, new)["hlc_state"]["list_detected_obstacle"]
+    assert d["remove"] == [0]
+    assert [o["id"] for o in d["upsert"]] == [1, 99]
+    assert_round_trip(old, new)
+
+
+def test_reordered_obstacles_are_replaced(frames):
+    old = frames(1)[0]
+
+    def reverse(hlc):
+        hlc["list_detected_obstacle"].reverse()
+
+    new = modified(old, reverse)
+
+    assert isinstance(delta.diff(old, new)["hlc_state"]["list_detected_obstacle"], list)
+    assert_round_trip(old, new)
+
+
+def test_log_sends_keyframes_and_deltas(frames):
+    ps = frames(5)
+    log = delta.DeltaLog(keyframe_interval=3)
+    for version, p in enumerate(ps[:3]):
+        log.record(version, p)
+
+    key = json.loads(log.message())
+    assert key["key"] and key["version"] == 2
+    assert key["state"] == state(ps[2])
+
+    message = json.loads(log.message(since=1))
+    assert message["base"] == 1
+    assert delta.apply(state(ps[1]), message["delta"]) == state(ps[2])
+
+    # Past the keyframe interval the old bases are gone.
+    log.record(3, ps[3])
+    assert json.loads(log.message(since=1))["key"]
+
+
+def test_non_finite_values_are_null(frames):
+    # ttc is inf while nothing is ahead; JSON has no Infinity.
+    ps = frames(3)
+    states = [state(p) for p in ps]
+    states[1]["tram_state_transition"]["ttc"] = float("inf")
+    states[2]["tram_state_transition"]["ttc"] = float("nan")
+    ps = [DMPlot.model_validate(s) for s in states]
+    log = delta.DeltaLog()
+    log.record(0, ps[0])
+    log.record(1, ps[1])
+
+    key = json.loads(log.message(), parse_constant=pytest.fail)
+    assert key["state"]["tram_state_transition"]["ttc"] is None
+    message = json.loads(log.message(since=0), parse_constant=pytest.fail)
+    assert message["delta"]["tram_state_transition"]["ttc"] is None
+
+    log.record(2, ps[2])
+    message = json.loads(log.message(since=1), parse_constant=pytest.fail)
+    assert message["delta"]["tram_state_transition"]["ttc"] is None
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from dmvis import OBSTACLE_DTYPE, HLCState, ObstacleState, Position
+
+
+def hlc(**lists):
+    state = {
+        "speed_setpoint": 1.0,
+        "list_rail_horizon": [],
+        "list_detected_object": [],
+        "list_trajectory_prediction": [],
+        "list_detected_obstacle": [],
+        "list_detected_railway_obstacle": [],
+    }
+    state.update(lists)
+    return HLCState.model_validate(state)
+
+
+def obstacle(id, x=1.0):
+    return {"id": id, "x": x, "y": 2.0, "v": 3.0, "d": 4.0}
+
+
+def test_points_become_arrays():
+    h = hlc(list_rail_horizon=[{"x": 1, "y": 2.5}])
+
+    np.testing.assert_array_equal(h.list_rail_horizon, [[1.0, 2.5]])
+    assert h.list_detected_object.shape == (0, 2)
+
+
+def test_point_models_are_accepted():
+    h = hlc(list_rail_horizon=[Position(x=3.0, y=4.0)])
+
+    np.testing.assert_array_equal(h.list_rail_horizon, [[3.0, 4.0]])
+
+
+@pytest.mark.parametrize(
+    "points", [[{"x": 1.0}], [{"x": 1.0, "y": "north"}], [{"x": 1.0, "y": None}], 5]
+)
+def test_bad_points_are_rejected(points):
+    with pytest.raises(ValidationError):
+        hlc(list_rail_horizon=points)
+
+
+def test_obstacles_become_structured_arrays():
+    h = hlc(
+        list_detected_obstacle=[obstacle(7), ObstacleState(**obstacle(8, x=5.0))]
+    )
+
+    obstacles = h.list_detected_obstacle
+    assert obstacles.dtype == OBSTACLE_DTYPE
+    assert obstacles["id"].tolist() == [7, 8]
+    assert obstacles["x"].tolist() == [1.0, 5.0]
+
+
+@pytest.mark.parametrize("id", [2**63 - 1, -(2**63)])
+def test_obstacle_id_limits(id):
+    h = hlc(list_detected_obstacle=[obstacle(id)])
+
+    assert h.list_detected_obstacle["id"][0] == id
+
+
+@pytest.mark.parametrize("id", [2**63, 2**70, -(2**63) - 1, 1.5, "one"])
+def test_bad_obstacle_ids_are_rejected(id):
+    with pytest.raises(ValidationError):
+        hlc(list_detected_obstacle=[obstacle(id)])
+
+
+def test_obstacles_need_every_field():
+    with pytest.raises(ValidationError):
+        hlc(list_detected_obstacle=[{"id": 1, "x": 1.0}])
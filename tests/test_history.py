@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from history import History
+
+
+def filled(n, capacity=5):
+    h = History(("t", "v"), capacity)
+    for i in range(n):
+        h.append((float(i), 10.0 * i))
+    return h
+
+
+def test_empty():
+    h = filled(0)
+
+    assert len(h) == 0
+    assert h.latest() is None
+    assert h.tail().shape == (2, 0)
+
+
+def test_before_the_ring_fills():
+    h = filled(3)
+
+    assert len(h) == 3
+    np.testing.assert_array_equal(h.tail(), [[0, 1, 2], [0, 10, 20]])
+    np.testing.assert_array_equal(h.latest(), [2, 20])
+
+
+@pytest.mark.parametrize("n", [5, 6, 9, 10, 11, 23])
+def test_wraparound_keeps_the_newest_in_order(n):
+    h = filled(n)
+
+    expected = np.arange(n - 5, n, dtype=float)
+    assert len(h) == 5
+    np.testing.assert_array_equal(h.tail()[0], expected)
+    np.testing.assert_array_equal(h.tail()[1], 10 * expected)
+    np.testing.assert_array_equal(h.latest(), [n - 1, 10 * (n - 1)])
+
+
+def test_tail_is_a_view_of_the_newest():
+    h = filled(12)
+
+    np.testing.assert_array_equal(h.tail(2)[0], [10, 11])
+    np.testing.assert_array_equal(h.tail(100)[0], [7, 8, 9, 10, 11])
+    assert np.shares_memory(h.tail(), h._buf)
+
+
+@pytest.mark.parametrize(
+    "t0, expected", [(-1.0, [4, 5, 6, 7, 8]), (6.0, [6, 7, 8]), (6.5, [7, 8]), (9, [])]
+)
+def test_since(t0, expected):
+    h = filled(9)
+
+    np.testing.assert_array_equal(h.since(t0)[0], expected)
+
+
+def test_clear():
+    h = filled(7)
+
+    h.clear()
+    h.append((100.0, 1.0))
+
+    assert len(h) == 1
+    np.testing.assert_array_equal(h.tail(), [[100.0], [1.0]])
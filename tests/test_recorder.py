@@ -0,0 +1,113 @@
+import threading
+
+import numpy as np
+import pytest
+
+import recorder
+from recorder import FlightRecorder, Recording
+
+
+def record(path, ps, chunk_frames=16):
+    recorder = FlightRecorder(str(path), chunk_frames=chunk_frames)
+    for p in ps:
+        recorder.record(p)
+    recorder.close()
+    assert recorder.dropped == 0
+    return Recording(str(path))
+
+
+def test_round_trip(tmp_path, frames):
+    ps = frames(40)
+
+    recording = record(tmp_path / "a.dmrec", ps)
+
+    # Chunks store float64 columns, so frames come back exactly.
+    assert len(recording) == len(ps)
+    for n, p in enumerate(ps):
+        assert recording.frame(n).model_dump(mode="json") == p.model_dump(mode="json")
+    assert [q.tram_state.t for q in recording.frames(5, 25)] == [
+        p.tram_state.t for p in ps[5:25]
+    ]
+
+
+def test_columns_span_chunks(tmp_path, frames):
+    ps = frames(40)
+
+    recording = record(tmp_path / "a.dmrec", ps)
+
+    np.testing.assert_array_equal(
+        recording.column("t", 10, 35), [p.tram_state.t for p in ps[10:35]]
+    )
+    np.testing.assert_array_equal(
+        recording.column("speed", 0, 40),
+        [p.tram_state_transition.speed for p in ps],
+    )
+
+
+def test_seek(tmp_path, frames):
+    ps = frames(40)
+    recording = record(tmp_path / "a.dmrec", ps)
+    ts = [p.tram_state.t for p in ps]
+
+    assert recording.seek(ts[0] - 1.0) == 0
+    assert recording.seek(ts[17]) == 17
+    assert recording.seek((ts[17] + ts[18]) / 2) == 17
+    assert recording.seek(ts[-1] + 1.0) == len(ps) - 1
+
+
+def test_append_and_reopen(tmp_path, frames):
+    ps = frames(30)
+    path = tmp_path / "a.dmrec"
+
+    record(path, ps[:10])
+    recording = record(path, ps[10:], chunk_frames=8)
+
+    assert len(recording) == len(ps)
+    assert recording.frame(29).model_dump(mode="json") == ps[29].model_dump(mode="json")
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "a.dmrec"
+    path.write_bytes(b"not a recording")
+
+    with pytest.raises(ValueError, match="not a DMVis recording"):
+        Recording(str(path))
+
+
+def test_failed_writes_drop_only_their_chunk(frames, tmp_path, monkeypatch, caplog):
+    real_append = recorder._append
+    calls = []
+
+    def append(f, data):
+        calls.append(f)
+        # The second chunk hits a full disk.
+        if len(calls) == 4:
+            raise OSError(28, "No space left on device")
+        return real_append(f, data)
+
+    monkeypatch.setattr(recorder, "_append", append)
+    ps = frames(30)
+
+    r = FlightRecorder(str(tmp_path / "a.dmrec"), chunk_frames=10)
+    for p in ps:
+        r.record(p)
+    r.close()
+
+    assert (r.recorded, r.dropped, r.failed) == (20, 10, 1)
+    assert "writing 10 frames failed" in caplog.text
+    recording = Recording(str(tmp_path / "a.dmrec"))
+    assert [p.tram_state.t for p in recording.frames()] == [
+        p.tram_state.t for p in ps[:10] + ps[20:]
+    ]
+
+
+def test_close_does_not_block_without_a_writer(tmp_path, frames):
+    r = FlightRecorder(str(tmp_path / "a.dmrec"), max_pending=1)
+    r.close()
+    # Nothing is left to drain the queue.
+    r.record(frames(1)[0])
+
+    closing = threading.Thread(target=r.close, daemon=True)
+    closing.start()
+    closing.join(5)
+    assert not closing.is_alive()
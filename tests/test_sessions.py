@@ -0,0 +1,117 @@
+from sessions import SessionStore
+
+
+class FakeSession:
+    def __init__(self, session_id):
+        self.id = session_id
+        self.bytes = 100
+        self.started = False
+        self.closed = False
+
+    def memory_bytes(self):
+        return self.bytes
+
+    def start(self):
+        self.started = True
+
+    def close(self):
+        self.closed = True
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def store(monkeypatch, max_bytes=10_000, idle_timeout=60.0, pinned=()):
+    clock = Clock()
+    monkeypatch.setattr("sessions.time.monotonic", clock)
+    return SessionStore(FakeSession, max_bytes, idle_timeout, pinned), clock
+
+
+def test_get_creates_and_starts(monkeypatch):
+    s, _ = store(monkeypatch)
+
+    a = s.get("a")
+
+    assert a.started and s.get("a") is a
+    assert s.get("b", create=False) is None
+    assert s.ids() == ["a"]
+
+
+def test_idle_sessions_are_evicted(monkeypatch):
+    s, clock = store(monkeypatch)
+    a = s.get("a")
+    s.get("b")
+
+    clock.now += 30
+    s.get("b")
+    assert "a" in s
+
+    clock.now += 31
+    s.get("b")
+    assert "a" not in s and a.closed
+
+
+def test_touch_keeps_a_session_alive(monkeypatch):
+    s, clock = store(monkeypatch)
+    a = s.get("a")
+
+    # A stream feeding "a" for longer than the idle timeout.
+    for _ in range(5):
+        clock.now += 30
+        s.touch("a")
+        s.get("b")
+
+    assert "a" in s and not a.closed
+    s.touch("missing")
+    assert "missing" not in s
+
+
+def test_least_recently_used_go_first_over_the_memory_limit(monkeypatch):
+    s, _ = store(monkeypatch, max_bytes=250)
+    a = s.get("a")
+    b = s.get("b")
+    s.get("a")
+
+    s.get("c")
+
+    assert s.ids() == ["a", "c"]
+    assert b.closed and not a.closed
+
+
+def test_touch_counts_as_use_for_memory_eviction(monkeypatch):
+    s, _ = store(monkeypatch, max_bytes=250)
+    s.get("a")
+    s.get("b")
+    s.touch("a")
+
+    s.get("c")
+
+    assert s.ids() == ["a", "c"]
+
+
+def test_pinned_sessions_stay(monkeypatch):
+    s, clock = store(monkeypatch, max_bytes=150, pinned=["default"])
+    default = s.get("default")
+
+    clock.now += 3600
+    s.get("a")
+
+    assert "default" in s and not default.closed
+
+
+def test_remove_and_close_all(monkeypatch):
+    s, _ = store(monkeypatch)
+    a = s.get("a")
+    b = s.get("b")
+
+    s.remove("a")
+    assert a.closed and "a" not in s
+    s.remove("a")
+
+    s.close_all()
+    assert b.closed and len(s) == 0
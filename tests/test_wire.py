@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+import wire
+from dmvis import DMPlot
+
+POINT_FIELDS = (
+    "list_rail_horizon",
+    "list_detected_object",
+    "list_trajectory_prediction",
+)
+OBSTACLE_FIELDS = (
+    "list_detected_obstacle",
+    "list_detected_railway_obstacle",
+)
+
+
+def with_obstacle_id(p: DMPlot, id: int) -> DMPlot:
+    state = p.model_dump(mode="json")
+    state["hlc_state"]["list_detected_obstacle"][0]["id"] = id
+    return DMPlot.model_validate(state)
+
+
+def test_round_trip(frames):
+    for p in frames():
+        decoded = wire.decode(wire.encode(p))
+
+        # Scalars travel as doubles, list contents as float32.
+        assert decoded.tram_state == p.tram_state
+        assert decoded.tram_state_transition == p.tram_state_transition
+        assert decoded.hlc_state.speed_setpoint == p.hlc_state.speed_setpoint
+        for name in POINT_FIELDS:
+            np.testing.assert_allclose(
+                getattr(decoded.hlc_state, name), getattr(p.hlc_state, name), rtol=1e-6
+            )
+        for name in OBSTACLE_FIELDS:
+            got = getattr(decoded.hlc_state, name)
+            want = getattr(p.hlc_state, name)
+            np.testing.assert_array_equal(got["id"], want["id"])
+            for field in ("x", "y", "v", "d"):
+                np.testing.assert_allclose(got[field], want[field], rtol=1e-6)
+
+
+def test_empty_lists(frames):
+    state = frames(1)[0].model_dump(mode="json")
+    for name in POINT_FIELDS + OBSTACLE_FIELDS:
+        state["hlc_state"][name] = []
+    p = DMPlot.model_validate(state)
+
+    decoded = wire.decode(wire.encode(p))
+
+    for name in POINT_FIELDS:
+        assert getattr(decoded.hlc_state, name).shape == (0, 2)
+    for name in OBSTACLE_FIELDS:
+        assert len(getattr(decoded.hlc_state, name)) == 0
+
+
+@pytest.mark.parametrize("id", [2**31 - 1, -(2**31)])
+def test_obstacle_id_limits(id, frames):
+    p = with_obstacle_id(frames(1)[0], id)
+
+    decoded = wire.decode(wire.encode(p))
+
+    assert decoded.hlc_state.list_detected_obstacle["id"][0] == id
+
+
+@pytest.mark.parametrize("id", [2**31, -(2**31) - 1, 2**40])
+def test_obstacle_id_out_of_range(id, frames):
+    p = with_obstacle_id(frames(1)[0], id)
+
+    with pytest.raises(ValueError, match="obstacle ids"):
+        wire.encode(p)
+
+
+def test_decode_rejects_bad_frames(frames):
+    buf = wire.encode(frames(1)[0])
+
+    with pytest.raises(ValueError, match="shorter than its header"):
+        wire.decode(buf[: wire.HEADER.size - 1])
+    with pytest.raises(ValueError, match="not a DMPlot frame"):
+        wire.decode(b"XXXX" + buf[4:])
+    with pytest.raises(ValueError, match="expected"):
+        wire.decode(buf[:-1])
+
+
+def test_long_lists_do_not_fit(frames):
+    state = frames(1)[0].model_dump(mode="json")
+    state["hlc_state"]["list_rail_horizon"] = [{"x": 1.0, "y": 0.0}] * 70000
+    p = DMPlot.model_validate(state)
+
+    with pytest.raises(ValueError, match="does not fit"):
+        wire.encode(p)
+
@@ -0,0 +1,154 @@
+import struct
+
+import numpy as np
+
+from dmvis import OBSTACLE_DTYPE, DMPlot
+
+MEDIA_TYPE = "application/x-dmplot"
+MAGIC = b"DMP1"
+
+# magic, current_command, fsm_state,
+# tram x/y/v/t, safe_emergency_distance, lead_distance, ttc, dtc, speed,
+# speed_setpoint, then the lengths of the five lists in HLCState order.
+HEADER = struct.Struct("<4sbB10d5H")
+
+POINT_DTYPE = np.dtype([("x", "<f4"), ("y", "<f4")])
+WIRE_OBSTACLE_DTYPE = np.dtype(
+    [("id", "<i4"), ("x", "<f4"), ("y", "<f4"), ("v", "<f4"), ("d", "<f4")]
+)
+WIRE_ID_RANGE = np.iinfo(WIRE_OBSTACLE_DTYPE["id"])
+
+
+def _points_to_wire(points: np.ndarray) -> bytes:
+    return points.astype("<f4").tobytes()
+
+
+def _obstacles_to_wire(obstacles: np.ndarray) -> bytes:
+    # The model holds int64 ids; astype would wrap larger ones silently.
+    ids = obstacles["id"]
+    if len(ids) and (ids.min() < WIRE_ID_RANGE.min or ids.max() > WIRE_ID_RANGE.max):
+        raise ValueError(
+            f"obstacle ids must fit in {WIRE_ID_RANGE.dtype} for the wire format"
+        )
+    return obstacles.astype(WIRE_OBSTACLE_DTYPE).tobytes()
+
+
+def _wire_to_points(a: np.ndarray) -> np.ndarray:
+    return a.view("<f4").reshape(-1, 2).astype(np.float64)
+
+
+def _wire_to_obstacles(a: np.ndarray) -> np.ndarray:
+    return a.astype(OBSTACLE_DTYPE)
+
+
+def encode(p: DMPlot) -> bytes:
+    ts = p.tram_state
+    tst = p.tram_state_transition
+    hlc = p.hlc_state
+
+    arrays = [
+        hlc.list_rail_horizon,
+        hlc.list_detected_object,
+        hlc.list_trajectory_prediction,
+        hlc.list_detected_obstacle,
+        hlc.list_detected_railway_obstacle,
+    ]
+
+    # Callers fall back to JSON on ValueError, which struct.error is not.
+    # The lengths are uint16, so longer lists do not fit.
+    try:
+        header = HEADER.pack(
+            MAGIC,
+            ts.current_command,
+            tst.fsm_state,
+            ts.x,
+            ts.y,
+            ts.v,
+            ts.t,
+            tst.safe_emergency_distance,
+            tst.lead_distance,
+            tst.ttc,
+            tst.dtc,
+            tst.speed,
+            hlc.speed_setpoint,
+            *(len(a) for a in arrays),
+        )
+    except struct.error as e:
+        raise ValueError(f"DMPlot does not fit the wire format: {e}")
+
+    return b"".join(
+        [
+            header,
+            _points_to_wire(arrays[0]),
+            _points_to_wire(arrays[1]),
+            _points_to_wire(arrays[2]),
+            _obstacles_to_wire(arrays[3]),
+            _obstacles_to_wire(arrays[4]),
+        ]
+    )
+
+
+def decode(buf: bytes) -> DMPlot:
+    if len(buf) < HEADER.size:
+        raise ValueError("DMPlot frame is shorter than its header")
+
+    (
+        magic,
+        current_command,
+        fsm_state,
+        x,
+        y,
+        v,
+        t,
+        safe_emergency_distance,
+        lead_distance,
+        ttc,
+        dtc,
+        speed,
+        speed_setpoint,
+        *counts,
+    ) = HEADER.unpack_from(buf)
+
+    if magic != MAGIC:
+        raise ValueError("not a DMPlot frame")
+
+    dtypes = [POINT_DTYPE] * 3 + [WIRE_OBSTACLE_DTYPE] * 2
+    expected = HEADER.size + sum(n * dt.itemsize for n, dt in zip(counts, dtypes))
+    if len(buf) != expected:
+        raise ValueError(f"DMPlot frame is {len(buf)} bytes, expected {expected}")
+
+    arrays = []
+    offset = HEADER.size
+    for n, dt in zip(counts, dtypes):
+        arrays.append(np.frombuffer(buf, dtype=dt, count=n, offset=offset))
+        offset += n * dt.itemsize
+
+    # The arrays are already in the model's columnar form, so pydantic only
+    # has to check the scalar fields.
+    return DMPlot.model_validate(
+        {
+            "tram_state": {
+                "current_command": current_command,
+                "x": x,
+                "y": y,
+                "v": v,
+                "t": t,
+            },
+            "tram_state_transition": {
+                "fsm_state": fsm_state,
+                "safe_emergency_distance": safe_emergency_distance,
+                "lead_distance": lead_distance,
+                "ttc": ttc,
+                "dtc": dtc,
+                "speed": speed,
+            },
+            "hlc_state": {
+                "speed_setpoint": speed_setpoint,
+                "list_rail_horizon": _wire_to_points(arrays[0]),
+                "list_detected_object": _wire_to_points(arrays[1]),
+                "list_trajectory_prediction": _wire_to_points(arrays[2]),
+                "list_detected_obstacle": _wire_to_obstacles(arrays[3]),
+                "list_detected_railway_obstacle": _wire_to_obstacles(arrays[4]),
+            },
+        }
+    )